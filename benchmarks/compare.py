@@ -0,0 +1,116 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+class Comparison:
+    def __init__(self, baseline: Dict, current: Dict, threshold: float) -> None:
+        self.__baseline = baseline["results"]
+        self.__current = current["results"]
+        self.__threshold = threshold
+
+    def rows(self) -> List[Tuple[str, float, float, float]]:
+        rows = []
+        for name, result in self.__current.items():
+            base = self.__baseline.get(name)
+            if base is None:
+                continue
+            before = base["median"]
+            after = result["median"]
+            change = (after - before) / before if before else 0.0
+            rows.append((name, before, after, change))
+        return rows
+
+    def regressions(self) -> List[str]:
+        return [
+            name
+            for name, _, _, change in self.rows()
+            if change > self.__threshold
+        ]
+
+
+def config_differences(baseline: Dict, current: Dict) -> List[str]:
+    # timings of different corpora say nothing about the code
+    before = baseline.get("meta", {}).get("config", {})
+    after = current.get("meta", {}).get("config", {})
+    return sorted(
+        key
+        for key in before.keys() | after.keys()
+        if before.get(key) != after.get(key)
+    )
+
+
+def parse_budgets(values: List[str]) -> Dict[str, float]:
+    # NAME=MS pairs, absolute ceilings independent of the baseline
+    budgets = {}
+    for value in values:
+        name, _, ms = value.partition("=")
+        budgets[name] = float(ms) / 1000
+    return budgets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare benchmark results against a baseline"
+    )
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Allowed slowdown as a fraction of the baseline median",
+    )
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        metavar="NAME=MS",
+        help="Fail when a benchmark median exceeds MS milliseconds",
+    )
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    differences = config_differences(baseline, current)
+    if differences:
+        print(
+            "Reports were generated from different repositories, "
+            f"config differs in: {', '.join(differences)}"
+        )
+        sys.exit(2)
+
+    comparison = Comparison(baseline, current, args.threshold)
+
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, before, after, change in comparison.rows():
+        print(
+            f"{name:<28} {before * 1000:10.2f}ms {after * 1000:10.2f}ms "
+            f"{change:+8.1%}"
+        )
+
+    failures = [
+        f"{name} regressed more than {args.threshold:.0%}"
+        for name in comparison.regressions()
+    ]
+    for name, limit in parse_budgets(args.budget).items():
+        result = current["results"].get(name)
+        if result is not None and result["median"] > limit:
+            failures.append(
+                f"{name} took {result['median'] * 1000:.1f}ms, "
+                f"budget is {limit * 1000:.0f}ms"
+            )
+
+    if failures:
+        print("\nRegressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import random
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List
+
+
+@dataclass
+class RepoConfig:
+    files: int = 500
+    classes: int = 3
+    methods: int = 6
+    functions: int = 4
+    docstring_ratio: float = 0.5
+    nesting: int = 3
+    ignored_dirs: int = 2
+    ignored_files: int = 50
+    seed: int = 1
+
+
+class RepoGenerator:
+    __WORDS = [
+        "user",
+        "config",
+        "cache",
+        "session",
+        "request",
+        "parser",
+        "token",
+        "buffer",
+        "index",
+        "report",
+        "client",
+        "record",
+        "schema",
+        "event",
+        "worker",
+        "store",
+    ]
+    __VERBS = ["get", "set", "load", "save", "build", "parse", "find", "run"]
+    # ignored trees that the walker must never enter
+    __IGNORED = [".venv", "node_modules", "build", "dist"]
+    # written once into the first module whatever the seed, so exact
+    # search benchmarks always time a hit
+    KNOWN_SYMBOL = "get_user_1"
+
+    def __init__(self, config: RepoConfig) -> None:
+        self.__config = config
+        # every choice flows from the seed so runs are comparable
+        self.__rng = random.Random(config.seed)
+
+    def generate(self, root: Path) -> List[Path]:
+        if root.exists():
+            shutil.rmtree(root)
+        root.mkdir(parents=True)
+
+        ignored = self.__IGNORED[: self.__config.ignored_dirs]
+        (root / ".gitignore").write_text(
+            "".join(f"{name}/\n" for name in ignored if name != ".venv")
+        )
+
+        files = []
+        for i in range(self.__config.files):
+            path = root / self.__package_path(i) / f"module_{i}.py"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            text = self.__module()
+            if i == 0:
+                text += self.__known()
+            path.write_text(text)
+            files.append(path)
+
+        for name in ignored:
+            for i in range(self.__config.ignored_files):
+                path = root / name / f"pkg_{i % 5}" / f"vendored_{i}.py"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(self.__module())
+
+        return files
+
+    def __package_path(self, i: int) -> Path:
+        depth = i % (self.__config.nesting + 1)
+        parts = [f"pkg_{(i // (d + 1)) % 8}" for d in range(depth)]
+        return Path("src", *parts)
+
+    def __name(self) -> str:
+        return f"{self.__rng.choice(self.__VERBS)}_{self.__rng.choice(self.__WORDS)}"
+
+    def __class_name(self) -> str:
+        return "".join(
+            w.title() for w in self.__rng.sample(self.__WORDS, 2)
+        ) + str(self.__rng.randint(0, 999))
+
+    def __docstring(self, indent: str) -> str:
+        if self.__rng.random() >= self.__config.docstring_ratio:
+            return ""
+        words = " ".join(self.__rng.choices(self.__WORDS, k=8))
+        return f'{indent}"""{words.capitalize()}."""\n'
+
+    def __function(self, indent: str, is_method: bool) -> str:
+        name = self.__name() + f"_{self.__rng.randint(0, 99)}"
+        args = (
+            "self, value: int, *, flag: bool = False" if is_method else "value"
+        )
+        body = indent + "    "
+        callee = self.__name()
+        return (
+            f"{indent}def {name}({args}) -> int:\n"
+            f"{self.__docstring(body)}"
+            f"{body}result = {callee}(value) if flag else value\n"
+            f"{body}return result + len(str(value))\n\n"
+        )
+
+    def __known(self) -> str:
+        # takes nothing from the seeded stream, the rest of the corpus is
+        # the same with or without it
+        return f"def {self.KNOWN_SYMBOL}(value) -> int:\n    return value\n"
+
+    def __module(self) -> str:
+        out = [self.__docstring(""), "import os\nfrom typing import List\n\n\n"]
+
+        for _ in range(self.__config.classes):
+            out.append(f"class {self.__class_name()}:\n")
+            out.append(self.__docstring("    "))
+            for _ in range(self.__config.methods):
+                out.append(self.__function("    ", is_method=True))
+            out.append("\n")
+
+        for _ in range(self.__config.functions):
+            out.append(self.__function("", is_method=False))
+
+        return "".join(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate a deterministic synthetic python repository"
+    )
+    parser.add_argument("root", type=Path)
+    defaults = RepoConfig()
+    for key, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{key.replace('_', '-')}", type=type(value), default=value
+        )
+    args = parser.parse_args()
+
+    config = RepoConfig(**{key: getattr(args, key) for key in asdict(defaults)})
+    files = RepoGenerator(config).generate(args.root)
+    print(f"Generated {len(files)} files in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
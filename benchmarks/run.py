@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.generate import RepoConfig, RepoGenerator
+from src.analysis import Analyzer
+from src.indexer import Indexer
+from src.project import Project
+from src.search import Search
+from src.stats import Stats
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class BenchmarkRunner:
+    def __init__(
+        self,
+        repo: Path,
+        files: List[Path],
+        repeat: int,
+        jobs: Optional[int],
+    ) -> None:
+        self.__repo = repo
+        self.__files = files
+        self.__repeat = repeat
+        self.__jobs = jobs
+        self.__results: Dict[str, Dict] = {}
+
+    def run(self) -> Dict[str, Dict]:
+        Project.init(self.__repo)
+        project = Project.load(self.__repo)
+
+        # indexing is timed without the parse cache so every run parses,
+        # cache hits have their own case
+        self.__time(
+            "index_fresh",
+            lambda: Indexer(project, parse_cache=False).index(
+                fresh=True, jobs=self.__jobs
+            ),
+        )
+        self.__time(
+            "index_noop", lambda: Indexer(project, parse_cache=False).index()
+        )
+
+        edits = iter(range(self.__repeat))
+        self.__time(
+            "index_incremental_1pct",
+            lambda: Indexer(project, parse_cache=False).index(jobs=self.__jobs),
+            setup=lambda: self.__touch_files(next(edits)),
+        )
+
+        # one uncached run fills the cache, the timed ones only hit it
+        Indexer(project).index(fresh=True, jobs=self.__jobs)
+        self.__time(
+            "index_fresh_cached",
+            lambda: Indexer(project).index(fresh=True, jobs=self.__jobs),
+        )
+
+        search = Search(project)
+        self.__time(
+            "search_exact", lambda: search.find(RepoGenerator.KNOWN_SYMBOL)
+        )
+        self.__time("search_partial", lambda: search.find("user", partial=True))
+        self.__time("search_fuzzy", lambda: search.find("get_usre", fuzzy=True))
+        self.__time("stats", lambda: Stats(project).generate())
+        self.__time("unused", lambda: Analyzer(project).find_unused_symbols())
+        self.__time("cli_search_startup", self.__cli_search)
+
+        return self.__results
+
+    def __time(
+        self,
+        name: str,
+        func: Callable[[], object],
+        setup: Optional[Callable[[], None]] = None,
+    ) -> None:
+        runs = []
+        for _ in range(self.__repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+
+        self.__results[name] = {
+            "median": statistics.median(runs),
+            "min": min(runs),
+            "runs": runs,
+        }
+        print(f"  {name:<28} {statistics.median(runs) * 1000:10.2f} ms")
+
+    def __touch_files(self, round_number: int) -> None:
+        # a different 1% of files each round so every run does real work
+        count = max(1, len(self.__files) // 100)
+        start = round_number * count
+        for path in self.__files[start : start + count]:
+            with open(path, "a") as f:
+                f.write(f"\n\ndef bench_edit_{round_number}():\n    pass\n")
+
+    def __cli_search(self) -> None:
+        # whole process, import time included
+        subprocess.run(
+            [
+                sys.executable,
+                str(ROOT / "main.py"),
+                "search",
+                RepoGenerator.KNOWN_SYMBOL,
+            ],
+            cwd=self.__repo,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the atlas benchmarks")
+    parser.add_argument("--output", "-o", type=Path, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        default=None,
+        help="Where to generate the synthetic repo, a temp dir by default",
+    )
+    defaults = RepoConfig()
+    for key, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{key.replace('_', '-')}", type=type(value), default=value
+        )
+    args = parser.parse_args()
+
+    config = RepoConfig(**{key: getattr(args, key) for key in asdict(defaults)})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the parse cache lives next to the repo, never in the user's one
+        os.environ["ATLAS_CACHE_DIR"] = str(Path(tmp) / "cache")
+        repo = (args.workdir or Path(tmp)) / "repo"
+        files = RepoGenerator(config).generate(repo)
+        print(f"Generated {len(files)} files in {repo}")
+
+        results = BenchmarkRunner(repo, files, args.repeat, args.jobs).run()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "jobs": args.jobs,
+            "config": asdict(config),
+        },
+        "results": results,
+    }
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
+import sys
 from src.cli import app
 
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        # required for worker processes in the pyinstaller binary
+        from multiprocessing import freeze_support
+
+        freeze_support()
     app()
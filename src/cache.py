@@ -0,0 +1,243 @@
+import marshal
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.limits import Limits
+from src.parsers.base import ParseResult
+from src.parsers.parser import Parser
+from src.storage import Symbol
+
+
+class ParseCache:
+    # parse results keyed by content hash, shared by every project of the
+    # user, so worktrees and branch switches reuse each other's parses
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    __DB_FILE = "parse-cache.db"
+    __IN_CHUNK = 500
+    # eviction trims to this share of the budget, not just under it
+    __EVICT_TO = 0.9
+
+    def __init__(
+        self,
+        directory: Path,
+        limits: Limits,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.__max_bytes = max_bytes
+        self.__namespace = self.namespace(limits)
+        # several atlas processes may share the file, writers wait
+        self.__conn = sqlite3.connect(directory / self.__DB_FILE, timeout=10)
+        self.__conn.execute("PRAGMA journal_mode = WAL")
+        self.__conn.execute("PRAGMA synchronous = NORMAL")
+        self.__conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                used INTEGER NOT NULL
+            )
+        """)
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(used)"
+        )
+        # the total size of all entries, kept current by every write so
+        # eviction never has to sum the table
+        self.__conn.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        row = self.__conn.execute(
+            "SELECT 1 FROM metadata WHERE key = 'size'"
+        ).fetchone()
+        if row is None:
+            self.__conn.execute("""
+                INSERT OR IGNORE INTO metadata
+                SELECT 'size', COALESCE(SUM(size), 0) FROM entries
+            """)
+        self.__conn.commit()
+
+    @classmethod
+    def open(cls, limits: Limits) -> Optional["ParseCache"]:
+        # a missing or read-only home just means no cache
+        try:
+            return cls(cls.directory(), limits)
+        except (OSError, sqlite3.Error):
+            return None
+
+    @staticmethod
+    def directory() -> Path:
+        override = os.environ.get("ATLAS_CACHE_DIR")
+        if override:
+            return Path(override)
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(base) / "atlas"
+
+    @staticmethod
+    def namespace(limits: Limits) -> str:
+        # anything that changes what the parser returns for the same bytes
+        # is part of the key, old entries simply stop being hit
+        return ":".join(
+            (
+                str(Parser.VERSION),
+                f"py{sys.version_info[0]}.{sys.version_info[1]}",
+                str(limits.max_file_bytes),
+                str(int(limits.skip_generated)),
+            )
+        )
+
+    @staticmethod
+    def content_key(
+        namespace: str, algorithm: str, file_hash: str, file_path: str
+    ) -> str:
+        suffix = os.path.splitext(file_path)[1].lower()
+        return f"{namespace}:{suffix}:{algorithm}:{file_hash}"
+
+    def key(self, algorithm: str, file_hash: str, file_path: str) -> str:
+        return self.content_key(
+            self.__namespace, algorithm, file_hash, file_path
+        )
+
+    def get_many(self, keys: Dict[str, str]) -> Dict[str, ParseResult]:
+        # path -> key in, path -> result out for the keys that were found
+        by_key: Dict[str, List[str]] = {}
+        for path, key in keys.items():
+            by_key.setdefault(key, []).append(path)
+
+        found: Dict[str, bytes] = {}
+        unique = list(by_key)
+        try:
+            for i in range(0, len(unique), self.__IN_CHUNK):
+                chunk = unique[i : i + self.__IN_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = self.__conn.execute(
+                    f"SELECT key, data FROM entries "
+                    f"WHERE key IN ({placeholders})",
+                    chunk,
+                )
+                found.update(cursor.fetchall())
+
+            now = time.time_ns()
+            self.__conn.executemany(
+                "UPDATE entries SET used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self.__conn.commit()
+        except sqlite3.Error:
+            return {}
+
+        results = {}
+        for key, data in found.items():
+            for path in by_key[key]:
+                results[path] = self.decode(path, data)
+        return results
+
+    def put_many(self, items: Iterable[Tuple[str, ParseResult]]) -> None:
+        now = time.time_ns()
+        rows: Dict[str, Tuple[str, bytes, int, int]] = {}
+        for key, result in items:
+            data = self.encode(result)
+            rows[key] = (key, data, len(data), now)
+        if not rows:
+            return
+
+        try:
+            # the write lock is taken first so no other process changes
+            # the total between reading and writing it
+            self.__conn.execute("BEGIN IMMEDIATE")
+            total = self.__conn.execute(
+                "SELECT value FROM metadata WHERE key = 'size'"
+            ).fetchone()[0]
+            total -= self.__sizes(list(rows))
+            self.__conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                rows.values(),
+            )
+            total = self.__evict(total + sum(row[2] for row in rows.values()))
+            self.__conn.execute(
+                "UPDATE metadata SET value = ? WHERE key = 'size'", (total,)
+            )
+            self.__conn.commit()
+        except sqlite3.Error:
+            # a busy or broken cache never fails an index run
+            self.__conn.rollback()
+
+    @staticmethod
+    def encode(result: ParseResult) -> bytes:
+        # paths are left out, the same content may live at any path.
+        # marshal is the fastest codec for plain tuples, the file only
+        # ever holds what this user's atlas wrote
+        symbols = [
+            (
+                s.symbol_name,
+                s.symbol_type,
+                s.line_number,
+                s.signature,
+                s.docstring,
+                s.qualified_name,
+            )
+            for s in result.symbols
+        ]
+        payload = (
+            symbols,
+            sorted(result.references),
+            result.sites,
+            result.skipped,
+        )
+        return zlib.compress(marshal.dumps(payload))
+
+    @staticmethod
+    def decode(file_path: str, data: bytes) -> ParseResult:
+        symbols, references, sites, skipped = marshal.loads(
+            zlib.decompress(data)
+        )
+        return ParseResult(
+            [
+                Symbol(name, kind, file_path, line, signature, docstring, qual)
+                for name, kind, line, signature, docstring, qual in symbols
+            ],
+            set(references),
+            sites,
+            skipped,
+        )
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    def __sizes(self, keys: List[str]) -> int:
+        # bytes the given keys take up now, replacing them frees as much
+        total = 0
+        for i in range(0, len(keys), self.__IN_CHUNK):
+            chunk = keys[i : i + self.__IN_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            total += self.__conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM entries "
+                f"WHERE key IN ({placeholders})",
+                chunk,
+            ).fetchone()[0]
+        return total
+
+    def __evict(self, total: int) -> int:
+        # least recently used entries go first, returns the new total
+        if total <= self.__max_bytes:
+            return total
+
+        excess = total - int(self.__max_bytes * self.__EVICT_TO)
+        stale: List[Tuple[str]] = []
+        cursor = self.__conn.execute(
+            "SELECT key, size FROM entries ORDER BY used"
+        )
+        for key, size in cursor:
+            stale.append((key,))
+            total -= size
+            excess -= size
+            if excess <= 0:
+                break
+        self.__conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        return total
@@ -1,13 +1,14 @@
-from src.analysis import Analyzer
+import sys
+import time
 import typer
+from enum import Enum
 from pathlib import Path
-from importlib.metadata import version, PackageNotFoundError
-from src.indexer import Indexer
+from typing import List, Optional
 from src.project import Project
-from src.search import Search
-from src.stats import Stats
 from src.ui import UI
-from src.updater import Updater
+
+# editor integrations spawn `atlas search` constantly, so every command
+# imports its engine itself and rich is only loaded by UI when rendering
 
 app = typer.Typer(
     name="atlas",
@@ -17,18 +18,101 @@ app = typer.Typer(
 )
 ui = UI()
 
-try:
-    VERSION = version("atlas")
-except PackageNotFoundError:
-    VERSION = "0.0.0-dev"
+
+class TimingsFormat(str, Enum):
+    text = "text"
+    json = "json"
+
+
+class OutputFormat(str, Enum):
+    rich = "rich"
+    plain = "plain"
+    json = "json"
+
+
+class ReferenceKind(str, Enum):
+    call = "call"
+    attribute = "attribute"
+    imports = "import"
+    name = "name"
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    timings: Optional[TimingsFormat] = typer.Option(
+        None,
+        "--timings",
+        help="Report per-phase timings and counters after the command",
+    ),
+    profile: Optional[Path] = typer.Option(
+        None,
+        "--profile",
+        dir_okay=False,
+        help="Write a cProfile dump of the whole command to this file",
+    ),
+    read_only: bool = typer.Option(
+        False,
+        "--read-only",
+        envvar="ATLAS_READ_ONLY",
+        help="Open the index immutable and memory-mapped for queries, "
+        "only safe while nothing is indexing",
+    ),
+):
+    """Project Scoped Codebase Indexer"""
+    ctx.obj = {"read_only": read_only}
+    # close callbacks run last registered first, so the profile is
+    # dumped before the timing report is rendered
+    if timings is not None:
+        from src.timings import Timings, set_timings
+
+        collected = Timings()
+        set_timings(collected)
+        start = time.perf_counter()
+
+        def report() -> None:
+            collected.phases["total"] = time.perf_counter() - start
+            ui.print_timings(
+                collected.to_dict(), as_json=timings == TimingsFormat.json
+            )
+
+        ctx.call_on_close(report)
+
+    if profile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump() -> None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        ctx.call_on_close(dump)
+
+
+def get_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("atlas")
+    except PackageNotFoundError:
+        return "0.0.0-dev"
 
 
 @app.command()
-def init():
+def init(
+    shards: Optional[List[str]] = typer.Option(
+        None,
+        "--shard",
+        help="Give each directory matching this glob its own index, "
+        "e.g. 'packages/*', repeat for more patterns",
+    ),
+):
     """Initialize atlas in current directory"""
     cwd = Path.cwd()
     try:
-        Project.init(cwd)
+        Project.init(cwd, shards=shards or None)
         ui.print_success(f"Initialized atlas in {cwd}")
     except Exception as e:
         ui.print_error(f"Failed to initialize: {e}")
@@ -43,17 +127,58 @@ def index(
         "-f",
         help="Re-index from scratch",
     ),
+    verify: bool = typer.Option(
+        False,
+        "--verify",
+        help="Hash every file instead of trusting unchanged stat info",
+    ),
+    jobs: Optional[int] = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Parser processes to use, defaults to the CPU count",
+    ),
+    batch_size: Optional[int] = typer.Option(
+        None,
+        "--batch-size",
+        min=1,
+        help="Files written per database transaction, defaults to 500",
+    ),
+    hash_algorithm: Optional[str] = typer.Option(
+        None,
+        "--hash",
+        help="Change detection hash: blake2b, md5, sha1, sha256 or git. "
+        "git lists files through git and takes clean tracked files' blob "
+        "ids from its index instead of reading them. Switching re-hashes "
+        "stored files without re-parsing them",
+    ),
+    cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        envvar="ATLAS_PARSE_CACHE",
+        help="Reuse parse results of identical content from other "
+        "checkouts, kept in ~/.cache/atlas",
+    ),
 ):
     """Index the project"""
+    from src.indexer import Indexer
+
     cwd = Path.cwd()
     try:
         project = Project.load(cwd)
-        indexer = Indexer(project)
+        indexer = Indexer(project, parse_cache=cache)
 
         msg = "Re-indexing from scratch..." if fresh else "Indexing project..."
 
         with ui.console.status(msg):
-            symbols = indexer.index(fresh=fresh)
+            symbols = indexer.index(
+                fresh=fresh,
+                verify=verify,
+                jobs=jobs,
+                batch_size=batch_size,
+                hash_algorithm=hash_algorithm,
+            )
 
         ui.print_stats(symbols)
     except FileNotFoundError:
@@ -64,20 +189,107 @@ def index(
         raise typer.Exit(code=1)
 
 
+@app.command()
+def watch(
+    poll: bool = typer.Option(
+        False,
+        "--poll",
+        help="Poll for changes instead of using filesystem events",
+    ),
+    debounce: float = typer.Option(
+        0.2,
+        "--debounce",
+        min=0.0,
+        help="Seconds without changes before re-indexing",
+    ),
+):
+    """Keep the index updated as files change"""
+    from src.watcher import Watcher
+
+    cwd = Path.cwd()
+    try:
+        project = Project.load(cwd)
+        watcher = Watcher(project, debounce=debounce, poll=poll)
+
+        with ui.console.status("Syncing index..."):
+            ui.print_watch_update(watcher.sync())
+
+        ui.print_success(
+            f"Watching {project.root} ({watcher.backend}), Ctrl+C to stop"
+        )
+        watcher.run(ui.print_watch_update)
+    except KeyboardInterrupt:
+        ui.print_warning("Stopped watching")
+    except FileNotFoundError:
+        ui.print_warning("atlas not initialized. Run 'atlas init'")
+        raise typer.Exit(code=1)
+    except Exception as e:
+        ui.print_error(f"Watch failed: {e}")
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def search(
-    query: str = typer.Argument(..., help="The symbol to search for"),
+    ctx: typer.Context,
+    query: str = typer.Argument(
+        ...,
+        help="A name, Class.method, Class.* for members, a trailing * "
+        "for a prefix, or module:pattern such as src.indexer:*",
+    ),
     partial: bool = typer.Option(
         False, "--partial", "-p", help="Enable partial search"
     ),
+    fuzzy: bool = typer.Option(
+        False,
+        "--fuzzy",
+        "-z",
+        help="Typo tolerant search ranked by edit distance",
+    ),
+    limit: Optional[int] = typer.Option(
+        None, "--limit", "-n", min=1, help="Show at most N results"
+    ),
+    offset: int = typer.Option(
+        0, "--offset", min=0, help="Skip the first N results"
+    ),
+    output: Optional[OutputFormat] = typer.Option(
+        None,
+        "--format",
+        help="rich, plain or json (one object per line), "
+        "plain by default when output is piped",
+    ),
+    docs: bool = typer.Option(
+        False, "--docs", "-d", help="Show each symbol's docstring"
+    ),
 ):
     """Search for symbols"""
+    if partial and fuzzy:
+        ui.print_error("Use either --partial or --fuzzy, not both")
+        raise typer.Exit(code=1)
+
+    from src.search import Search
+
+    if output is None:
+        tty = sys.stdout.isatty()
+        output = OutputFormat.rich if tty else OutputFormat.plain
+
     cwd = Path.cwd()
     try:
         project = Project.load(cwd)
-        search_engine = Search(project)
-        results = search_engine.find(query, partial=partial)
-        ui.print_search_results(query, results)
+        search_engine = Search(project, read_only=ctx.obj["read_only"])
+        results = search_engine.iter_find(
+            query,
+            partial=partial,
+            fuzzy=fuzzy,
+            limit=limit,
+            offset=offset,
+            docs=docs,
+        )
+        if output == OutputFormat.rich:
+            ui.print_search_results(query, results, limit, offset, docs=docs)
+        else:
+            ui.print_search_lines(
+                query, results, as_json=output == OutputFormat.json, docs=docs
+            )
     except FileNotFoundError:
         ui.print_warning("atlas not initialized or not indexed")
         raise typer.Exit(code=1)
@@ -87,14 +299,78 @@ def search(
 
 
 @app.command()
-def status():
+def refs(
+    ctx: typer.Context,
+    name: str = typer.Argument(
+        ..., help="Name to look up, e.g. find or os.path for an import"
+    ),
+    kind: Optional[ReferenceKind] = typer.Option(
+        None,
+        "--kind",
+        "-k",
+        help="Only calls, attribute accesses, imports or name loads",
+    ),
+    limit: Optional[int] = typer.Option(
+        None, "--limit", "-n", min=1, help="Show at most N results"
+    ),
+    offset: int = typer.Option(
+        0, "--offset", min=0, help="Skip the first N results"
+    ),
+    output: Optional[OutputFormat] = typer.Option(
+        None,
+        "--format",
+        help="rich, plain or json (one object per line), "
+        "plain by default when output is piped",
+    ),
+):
+    """Find where a name is called, accessed, imported or used"""
+    from src.search import Search
+
+    if output is None:
+        tty = sys.stdout.isatty()
+        output = OutputFormat.rich if tty else OutputFormat.plain
+
+    cwd = Path.cwd()
+    try:
+        project = Project.load(cwd)
+        search_engine = Search(project, read_only=ctx.obj["read_only"])
+        references = search_engine.iter_references(
+            name,
+            kind=kind.value if kind is not None else None,
+            limit=limit,
+            offset=offset,
+        )
+        if output == OutputFormat.rich:
+            ui.print_reference_results(name, references, limit, offset)
+        else:
+            ui.print_reference_lines(
+                name, references, as_json=output == OutputFormat.json
+            )
+    except FileNotFoundError:
+        ui.print_warning("atlas not initialized or not indexed")
+        raise typer.Exit(code=1)
+    except Exception as e:
+        ui.print_error(f"Reference lookup failed: {e}")
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def status(
+    verify: bool = typer.Option(
+        False,
+        "--verify",
+        help="Hash every file instead of trusting unchanged stat info",
+    ),
+):
     """Show indexing status"""
+    from src.indexer import Indexer
+
     cwd = Path.cwd()
     try:
         project = Project.load(cwd)
         indexer = Indexer(project)
         with ui.console.status("Checking file status..."):
-            diff = indexer.diff_changes()
+            diff = indexer.diff_changes(verify=verify)
         ui.print_file_status(diff)
     except FileNotFoundError:
         ui.print_warning("atlas not initialized or not indexed")
@@ -106,15 +382,18 @@ def status():
 
 @app.command()
 def stats(
+    ctx: typer.Context,
     limit: int = typer.Option(
         5, "--limit", "-l", help="Number of top files to show"
     ),
 ):
     """Show advanced codebase statistics"""
+    from src.stats import Stats
+
     cwd = Path.cwd()
     try:
         project = Project.load(cwd)
-        stats_engine = Stats(project)
+        stats_engine = Stats(project, read_only=ctx.obj["read_only"])
         with ui.console.status("Calculating stats..."):
             data = stats_engine.generate(limit=limit)
         ui.print_advanced_stats(data)
@@ -126,20 +405,70 @@ def stats(
         raise typer.Exit(code=1)
 
 
+@app.command()
+def export(
+    path: Path = typer.Argument(
+        ..., dir_okay=False, help="Snapshot file to write, e.g. atlas.zip"
+    ),
+):
+    """Write a portable snapshot of the index"""
+    from src.snapshot import Snapshot
+
+    cwd = Path.cwd()
+    try:
+        project = Project.load(cwd)
+        with ui.console.status("Exporting index..."):
+            manifest = Snapshot(project).export(path)
+        files = sum(db["files"] for db in manifest["databases"])
+        ui.print_success(f"Exported {files} indexed files to {path}")
+    except FileNotFoundError:
+        ui.print_warning("atlas not initialized or not indexed")
+        raise typer.Exit(code=1)
+    except Exception as e:
+        ui.print_error(f"Export failed: {e}")
+        raise typer.Exit(code=1)
+
+
+@app.command("import")
+def import_snapshot(
+    path: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="Snapshot written by export"
+    ),
+):
+    """Replace the index with a snapshot, then run index to catch up"""
+    from src.snapshot import Snapshot
+
+    cwd = Path.cwd()
+    try:
+        Project.init(cwd)
+        project = Project.load(cwd)
+        with ui.console.status("Importing snapshot..."):
+            manifest = Snapshot(project).restore(path)
+        files = sum(db["files"] for db in manifest["databases"])
+        ui.print_success(f"Imported {files} indexed files from {path}")
+    except Exception as e:
+        ui.print_error(f"Import failed: {e}")
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def upgrade():
     """Update atlas to the latest version"""
-    updater = Updater(VERSION, ui)
+    from src.updater import Updater
+
+    updater = Updater(get_version(), ui)
     updater.update()
 
 
 @app.command()
-def unused():
+def unused(ctx: typer.Context):
     """Find potentially unused symbols"""
+    from src.analysis import Analyzer
+
     cwd = Path.cwd()
     try:
         project = Project.load(cwd)
-        analyzer = Analyzer(project)
+        analyzer = Analyzer(project, read_only=ctx.obj["read_only"])
 
         with ui.console.status("Analyzing codebase for usage..."):
             unused_symbols = analyzer.find_unused_symbols()
@@ -156,4 +485,4 @@ def unused():
 @app.command()
 def version():
     """Show current version"""
-    ui.console.print(f"atlas version [bold cyan]{VERSION}[/bold cyan]")
+    ui.console.print(f"atlas version [bold cyan]{get_version()}[/bold cyan]")
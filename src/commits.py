@@ -0,0 +1,260 @@
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from src.cache import ParseCache
+from src.limits import Limits
+from src.parsers.base import ParseResult
+from src.project import Project
+
+
+class CommitSnapshots:
+    # the index as it was when HEAD first pointed at a tree, for the most
+    # recently visited trees. a snapshot only lists content keys, parse
+    # results are stored once per content and shared by every snapshot
+    # listing them. they are copied out of the index lazily, right before
+    # a write replaces the rows, so a snapshot costs nothing until the
+    # tree is left
+    DEFAULT_RETAIN = 8
+    __CONFIG_KEY = "snapshots"
+    __DB_FILE = "snapshots.db"
+    __IN_CHUNK = 500
+
+    def __init__(
+        self, project: Project, limits: Limits, retain: int = DEFAULT_RETAIN
+    ) -> None:
+        self.__retain = retain
+        self.__namespace = ParseCache.namespace(limits)
+        # watch mode and index may both write, writers wait
+        self.__conn = sqlite3.connect(
+            project.metadata_dir / self.__DB_FILE, timeout=10
+        )
+        self.__conn.execute("PRAGMA journal_mode = WAL")
+        self.__conn.execute("PRAGMA synchronous = NORMAL")
+        self.__create_schema()
+
+    @classmethod
+    def open(
+        cls, project: Project, limits: Limits, create: bool = True
+    ) -> Optional["CommitSnapshots"]:
+        # config.json {"snapshots": N} keeps N trees, 0 turns them off
+        retain = project.load_config().get(cls.__CONFIG_KEY, cls.DEFAULT_RETAIN)
+        if not retain:
+            return None
+        if not create and not (project.metadata_dir / cls.__DB_FILE).exists():
+            return None
+        try:
+            return cls(project, limits, retain)
+        except (OSError, sqlite3.Error):
+            return None
+
+    @property
+    def tree(self) -> Optional[str]:
+        # the tree HEAD pointed at when the index was last synced
+        row = self.__conn.execute(
+            "SELECT value FROM metadata WHERE key = 'tree'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def key(self, algorithm: str, file_hash: str, file_path: str) -> str:
+        # the parse cache's key, so both stores agree on what is the same
+        return ParseCache.content_key(
+            self.__namespace, algorithm, file_hash, file_path
+        )
+
+    def get_many(self, keys: Dict[str, str]) -> Dict[str, ParseResult]:
+        # path -> key in, path -> result out for the stored keys
+        found = self.__select(
+            "SELECT key, data FROM contents "
+            "WHERE data IS NOT NULL AND key IN ({})",
+            set(keys.values()),
+        )
+        return {
+            path: ParseCache.decode(path, found[key])
+            for path, key in keys.items()
+            if key in found
+        }
+
+    def missing(self, keys: Dict[str, str]) -> Dict[str, str]:
+        # keys listed by a snapshot whose rows so far only live in the index
+        found = self.__select(
+            "SELECT key, 1 FROM contents WHERE data IS NULL AND key IN ({})",
+            set(keys.values()),
+        )
+        return {path: key for path, key in keys.items() if key in found}
+
+    def store(self, items: Iterable[Tuple[str, ParseResult]]) -> None:
+        rows = [(ParseCache.encode(result), key) for key, result in items]
+        if not rows:
+            return
+        try:
+            self.__conn.executemany(
+                "UPDATE contents SET data = ? WHERE key = ?", rows
+            )
+            self.__conn.commit()
+        except sqlite3.Error:
+            # a busy store only costs a parse when the tree comes back
+            self.__conn.rollback()
+
+    def rekey(self, keys: Dict[str, str]) -> None:
+        # old key -> new key of the same content, after the index changed
+        # its hash algorithm. a key already listed under its new name stays
+        rows = [(new, old) for old, new in keys.items() if old != new]
+        if not rows:
+            return
+        try:
+            self.__conn.executemany(
+                "UPDATE OR IGNORE contents SET key = ? WHERE key = ?", rows
+            )
+            self.__conn.commit()
+        except sqlite3.Error:
+            self.__conn.rollback()
+
+    def record(self, commit: str, tree: str, keys: Iterable[str]) -> None:
+        # a tree seen before is marked used, its key list is rewritten
+        # whenever it differs from the one given
+        listing = set(keys)
+        now = time.time_ns()
+        try:
+            cursor = self.__conn.cursor()
+            cursor.execute("SELECT id FROM snapshots WHERE tree = ?", (tree,))
+            row = cursor.fetchone()
+            listed: Set[str] = set()
+            if row is None:
+                cursor.execute(
+                    """
+                    INSERT INTO snapshots (tree, head, created, used)
+                    VALUES (?, ?, ?, ?)
+                """,
+                    (tree, commit, now, now),
+                )
+                snapshot_id = cursor.lastrowid
+            else:
+                snapshot_id = row[0]
+                cursor.execute(
+                    """
+                    SELECT c.key FROM snapshot_contents sc
+                    JOIN contents c ON c.id = sc.content_id
+                    WHERE sc.snapshot_id = ?
+                """,
+                    (snapshot_id,),
+                )
+                listed = {key for (key,) in cursor.fetchall()}
+                if listed == listing and tree == self.tree:
+                    return
+                cursor.execute(
+                    "UPDATE snapshots SET head = ?, used = ? WHERE id = ?",
+                    (commit, now, snapshot_id),
+                )
+
+            added = [(key,) for key in listing - listed]
+            cursor.executemany(
+                "INSERT OR IGNORE INTO contents (key) VALUES (?)", added
+            )
+            cursor.executemany(
+                f"""
+                INSERT INTO snapshot_contents (snapshot_id, content_id)
+                SELECT {snapshot_id}, id FROM contents WHERE key = ?
+            """,
+                added,
+            )
+            removed = [(key,) for key in listed - listing]
+            cursor.executemany(
+                f"""
+                DELETE FROM snapshot_contents WHERE snapshot_id = {snapshot_id}
+                AND content_id = (SELECT id FROM contents WHERE key = ?)
+            """,
+                removed,
+            )
+            # content no other snapshot lists goes with it
+            cursor.executemany(
+                """
+                DELETE FROM contents WHERE key = ? AND NOT EXISTS (
+                    SELECT 1 FROM snapshot_contents sc
+                    WHERE sc.content_id = contents.id
+                )
+            """,
+                removed,
+            )
+            self.__prune(cursor)
+            cursor.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('tree', ?)", (tree,)
+            )
+            self.__conn.commit()
+        except sqlite3.Error:
+            self.__conn.rollback()
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    def __create_schema(self) -> None:
+        cursor = self.__conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                tree TEXT UNIQUE NOT NULL,
+                head TEXT NOT NULL,
+                created INTEGER NOT NULL,
+                used INTEGER NOT NULL
+            )
+        """)
+        # data stays NULL while the index still holds the rows
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS contents (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                data BLOB
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS snapshot_contents (
+                snapshot_id INTEGER NOT NULL,
+                content_id INTEGER NOT NULL,
+                PRIMARY KEY (snapshot_id, content_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_snapshot_contents_content
+            ON snapshot_contents(content_id)
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self.__conn.commit()
+
+    def __prune(self, cursor: sqlite3.Cursor) -> None:
+        # least recently visited trees go first, then every content no
+        # remaining snapshot lists
+        cursor.execute(
+            "SELECT id FROM snapshots ORDER BY used DESC LIMIT -1 OFFSET ?",
+            (self.__retain,),
+        )
+        stale: List[Tuple[int]] = cursor.fetchall()
+        if not stale:
+            return
+
+        cursor.executemany(
+            "DELETE FROM snapshot_contents WHERE snapshot_id = ?", stale
+        )
+        cursor.executemany("DELETE FROM snapshots WHERE id = ?", stale)
+        cursor.execute("""
+            DELETE FROM contents WHERE NOT EXISTS (
+                SELECT 1 FROM snapshot_contents sc
+                WHERE sc.content_id = contents.id
+            )
+        """)
+
+    def __select(self, sql: str, keys: Iterable[str]) -> Dict[str, bytes]:
+        unique = list(keys)
+        found: Dict[str, bytes] = {}
+        try:
+            for i in range(0, len(unique), self.__IN_CHUNK):
+                chunk = unique[i : i + self.__IN_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = self.__conn.execute(sql.format(placeholders), chunk)
+                found.update(cursor.fetchall())
+        except sqlite3.Error:
+            return {}
+        return found
@@ -0,0 +1,69 @@
+from typing import Set
+
+
+class Fuzzy:
+    # symspell style: every name prefix is stored under all the strings
+    # reachable by deleting up to MAX_DISTANCE characters from it, a query
+    # generates the same deletes and candidates are one index lookup away
+    MAX_DISTANCE = 2
+    PREFIX_LENGTH = 7
+
+    def prefix(self, name: str) -> str:
+        # the part of a name its variants are built from, names sharing it
+        # share every variant
+        return name.lower()[: self.PREFIX_LENGTH]
+
+    def variants(self, name: str, max_distance: int = MAX_DISTANCE) -> Set[str]:
+        prefix = self.prefix(name)
+        result = {prefix}
+        frontier = {prefix}
+
+        for _ in range(max_distance):
+            next_frontier: Set[str] = set()
+            for term in frontier:
+                for i in range(len(term)):
+                    deleted = term[:i] + term[i + 1 :]
+                    if deleted not in result:
+                        next_frontier.add(deleted)
+            result |= next_frontier
+            frontier = next_frontier
+
+        return result
+
+    def distance(self, a: str, b: str, max_distance: int) -> int:
+        # optimal string alignment distance, anything above max_distance
+        # is reported as max_distance + 1
+        a = a.lower()
+        b = b.lower()
+        if abs(len(a) - len(b)) > max_distance:
+            return max_distance + 1
+
+        prev_prev: list = []
+        prev = list(range(len(b) + 1))
+
+        for i in range(1, len(a) + 1):
+            current = [i] + [0] * len(b)
+            row_min = i
+            for j in range(1, len(b) + 1):
+                cost = 0 if a[i - 1] == b[j - 1] else 1
+                value = min(
+                    prev[j] + 1,
+                    current[j - 1] + 1,
+                    prev[j - 1] + cost,
+                )
+                if (
+                    i > 1
+                    and j > 1
+                    and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]
+                ):
+                    value = min(value, prev_prev[j - 2] + 1)
+                current[j] = value
+                row_min = min(row_min, value)
+
+            if row_min > max_distance:
+                return max_distance + 1
+
+            prev_prev, prev = prev, current
+
+        return min(prev[len(b)], max_distance + 1)
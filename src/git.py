@@ -0,0 +1,127 @@
+import os
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class GitFiles:
+    # blob id of every tracked file whose worktree copy matches the index
+    clean: Dict[str, str] = field(default_factory=dict)
+    # tracked but modified, unmerged, a symlink or not a sha-1 repository
+    dirty: Set[str] = field(default_factory=set)
+    # neither tracked nor ignored
+    untracked: Set[str] = field(default_factory=set)
+    # tracked files whose index entry no longer matches HEAD
+    staged: Set[str] = field(default_factory=set)
+
+
+class GitRepository:
+    # regular files only, a symlink's blob is its target, not its content
+    __REGULAR_MODES = (b"100644", b"100755")
+    __SHA1_LENGTH = 40
+
+    def __init__(self, root: Path) -> None:
+        self.__root = root
+        self.__lock = threading.Lock()
+        self.__loaded = False
+        self.__files: Optional[GitFiles] = None
+
+    def files(self) -> Optional[GitFiles]:
+        # listed once and shared by every shard, None outside a repository
+        # or without a git binary
+        with self.__lock:
+            if not self.__loaded:
+                self.__files = self.__list()
+                self.__loaded = True
+        return self.__files
+
+    def head(self) -> Optional[Tuple[str, str]]:
+        # (commit, tree) of HEAD, None before the first commit
+        output = self.__run("rev-parse", "HEAD", "HEAD^{tree}")
+        if output is None:
+            return None
+        lines = output.decode().split()
+        if len(lines) != 2:
+            return None
+        return lines[0], lines[1]
+
+    def __list(self) -> Optional[GitFiles]:
+        toplevel = self.__run("rev-parse", "--show-toplevel")
+        # the index stays untouched, status only refreshes it in memory
+        staged = self.__run("ls-files", "--stage", "--full-name", "-z")
+        status = self.__run(
+            "--no-optional-locks",
+            "status",
+            "--porcelain",
+            "-z",
+            "--untracked-files=all",
+            "--",
+            ".",
+        )
+        if toplevel is None or staged is None or status is None:
+            return None
+
+        top = os.fsdecode(toplevel.strip())
+        files = GitFiles()
+        self.__read_stage(top, staged, files)
+        self.__read_status(top, status, files)
+        return files
+
+    def __read_stage(self, top: str, output: bytes, files: GitFiles) -> None:
+        # <mode> <object> <stage>\t<path>
+        for line in output.split(b"\0"):
+            if not line:
+                continue
+            info, _, name = line.partition(b"\t")
+            mode, object_id, stage = info.split(b" ")
+            path = os.path.join(top, os.fsdecode(name))
+
+            if (
+                stage == b"0"
+                and mode in self.__REGULAR_MODES
+                and len(object_id) == self.__SHA1_LENGTH
+            ):
+                files.clean[path] = object_id.decode()
+            else:
+                files.clean.pop(path, None)
+                files.dirty.add(path)
+
+    def __read_status(self, top: str, output: bytes, files: GitFiles) -> None:
+        # XY <path>, renames and copies are followed by the source path
+        entries: List[bytes] = output.split(b"\0")
+        i = 0
+        while i < len(entries):
+            entry = entries[i]
+            i += 1
+            if not entry:
+                continue
+
+            state, name = entry[:2], entry[3:]
+            if state[:1] in (b"R", b"C"):
+                i += 1
+            path = os.path.join(top, os.fsdecode(name))
+
+            if state == b"??":
+                files.untracked.add(path)
+                continue
+            if state[:1] != b" ":
+                files.staged.add(path)
+            if state[1:] != b" " and path in files.clean:
+                # staged changes match the index id, worktree edits do not
+                del files.clean[path]
+                files.dirty.add(path)
+
+    def __run(self, *args: str) -> Optional[bytes]:
+        try:
+            result = subprocess.run(
+                ["git", "-C", str(self.__root), *args],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return result.stdout
@@ -0,0 +1,63 @@
+import hashlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# hashlib has no public type for its hash objects, blake2b is not even
+# the same class as the others
+HashFactory = Callable[[], Any]
+
+
+class Hasher:
+    # blake2b is faster than md5 on 64-bit cpus, 16 bytes is plenty
+    # for change detection and keeps file_hashes compact
+    ALGORITHMS: Dict[str, HashFactory] = {
+        "blake2b": lambda: hashlib.blake2b(digest_size=16),
+        "md5": hashlib.md5,
+        "sha1": hashlib.sha1,
+        "sha256": hashlib.sha256,
+        # git blob ids, sha-1 over a "blob <size>" header and the content
+        "git": hashlib.sha1,
+    }
+    DEFAULT = "blake2b"
+    # with this algorithm clean tracked files take their id from git
+    GIT = "git"
+    # indexes created before the algorithm was recorded used md5
+    LEGACY = "md5"
+    # above this size the file is streamed and not kept for parsing
+    __LARGE_FILE = 4 * 1024 * 1024
+
+    def __init__(self, algorithm: str = DEFAULT) -> None:
+        if algorithm not in self.ALGORITHMS:
+            supported = ", ".join(sorted(self.ALGORITHMS))
+            raise ValueError(
+                f"unsupported hash algorithm '{algorithm}', use {supported}"
+            )
+        self.algorithm = algorithm
+        self.__factory = self.ALGORITHMS[algorithm]
+        self.__blob = algorithm == self.GIT
+
+    def read(self, file_path: Path) -> Tuple[str, Optional[bytes]]:
+        # returns the digest and, for regular sized files, the bytes that
+        # were hashed so the parser does not have to read them again
+        with open(file_path, "rb") as f:
+            size = self.__size(f)
+            hasher = self.__new(size)
+            if size >= self.__LARGE_FILE:
+                return hashlib.file_digest(f, lambda: hasher).hexdigest(), None
+
+            data = f.read()
+
+        hasher.update(data)
+        return hasher.hexdigest(), data
+
+    def __new(self, size: int) -> "hashlib._Hash":
+        hasher = self.__factory()
+        if self.__blob:
+            hasher.update(b"blob %d\0" % size)
+        return hasher
+
+    def __size(self, f) -> int:
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(0)
+        return size
@@ -1,11 +1,24 @@
-from dataclasses import dataclass
-import hashlib
-import pathspec
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from functools import partial
+import itertools
+import json
+import os
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from src.cache import ParseCache
+from src.commits import CommitSnapshots
+from src.git import GitFiles, GitRepository
+from src.hashing import Hasher
+from src.limits import Limits
+from src.parsers.base import ParseResult
 from src.parsers.parser import Parser
 from src.project import Project
-from src.storage import Storage, Symbol
+from src.shards import Shard, Shards, fan_out
+from src.storage import FileRecord, Storage, Symbol
+from src.timings import Timings, get_timings, set_timings
+from src.walker import Walker
 
 
 @dataclass
@@ -13,95 +26,662 @@ class FileDiff:
     added: Set[str]
     modified: Set[str]
     deleted: Set[str]
-    current_hashes: Dict[str, str]
+    # content unchanged but stat tuple differs, only metadata needs refresh
+    touched: Set[str]
+    current_files: Dict[str, FileRecord]
+    # bytes read while hashing added or modified files, handed to the parser
+    contents: Dict[str, bytes] = field(default_factory=dict)
+    # indexed files the parser skipped or only partly indexed, with why
+    skipped: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.modified or self.deleted or self.touched)
+
+    @classmethod
+    def combine(cls, diffs: List["FileDiff"]) -> "FileDiff":
+        combined = cls(set(), set(), set(), set(), {})
+        for diff in diffs:
+            combined.added |= diff.added
+            combined.modified |= diff.modified
+            combined.deleted |= diff.deleted
+            combined.touched |= diff.touched
+            combined.current_files.update(diff.current_files)
+            combined.contents.update(diff.contents)
+            combined.skipped.update(diff.skipped)
+        return combined
+
+
+def _parse_batch(
+    items: List[Tuple[str, Optional[bytes]]],
+    limits: Limits,
+    collect_timings: bool = False,
+) -> Tuple[List[Tuple[str, ParseResult]], Optional[Timings]]:
+    # runs inside a worker process, parser state is cheap to rebuild
+    timings = Timings() if collect_timings else None
+    set_timings(timings)
+
+    parser = Parser(limits)
+    results = [
+        (path, parser.parse_file(Path(path), source)) for path, source in items
+    ]
+    return results, timings
 
 
 class Indexer:
-    def __init__(self, project: Project) -> None:
+    # below this many files a process pool costs more than it saves
+    __PARALLEL_MIN_FILES = 200
+    __BATCH_SIZE = 64
+    # parse results written to the cache per transaction
+    __CACHE_BATCH = 256
+    # file contents kept between hashing and parsing, the rest is re-read,
+    # shared out between the shards
+    __CONTENT_BUDGET = 256 * 1024 * 1024
+
+    def __init__(self, project: Project, parse_cache: bool = True) -> None:
         self.__project = project
-        self.__parser = Parser()
-        self.__storage = Storage(project)
-        self.__ignore_spec = self.__load_ignore_spec()
+        self.__root = project.root
+        self.__limits = Limits.load(project)
+        self.__parser = Parser(self.__limits)
+        self.__parse_cache = parse_cache
+        self.__shards = Shards(project)
+        budget = self.__CONTENT_BUDGET // len(self.__shards)
+        self.__indexes = {
+            shard.name: ShardIndex(project, shard, budget)
+            for shard in self.__shards
+        }
 
-    def index(self, fresh: bool = False) -> List[Symbol]:
+    def index(
+        self,
+        fresh: bool = False,
+        verify: bool = False,
+        jobs: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        hash_algorithm: Optional[str] = None,
+    ) -> List[Symbol]:
+        self.__shards.prune()
+        indexes = list(self.__indexes.values())
         if fresh:
-            self.__storage.clear_database()
+            for index in indexes:
+                index.storage.clear_database()
 
-        diff = self.diff_changes()
+        self.sync(
+            verify=verify,
+            jobs=jobs,
+            batch_size=batch_size,
+            hash_algorithm=hash_algorithm,
+        )
+        symbols = fan_out(lambda i: i.storage.get_all_symbols(), indexes)
+        return [symbol for part in symbols for symbol in part]
 
-        for path in diff.deleted:
-            self.__storage.remove_file(path)
+    def sync(
+        self,
+        verify: bool = False,
+        jobs: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        hash_algorithm: Optional[str] = None,
+    ) -> FileDiff:
+        indexes = list(self.__indexes.values())
+        # listed once for all shards, by those hashing with git and for
+        # the snapshot of HEAD's tree
+        git = GitRepository(self.__root)
+        # the root shard's algorithm is the project's, new shards follow it
+        algorithm = hash_algorithm or indexes[0].hash_algorithm
+        previous = [index.hash_algorithm for index in indexes]
+        rehashed = fan_out(lambda i: i.migrate_hashes(algorithm, git), indexes)
+        # a new parser version may judge skipped files differently too
+        limits = json.dumps(
+            {**asdict(self.__limits), "parser": Parser.VERSION}, sort_keys=True
+        )
+        fan_out(lambda i: i.storage.retry_skipped(limits), indexes)
 
-        to_process = diff.added | diff.modified
+        # shards walk and hash side by side, parsing shares one pool
+        diffs = fan_out(
+            lambda i: i.diff_changes(verify, keep_contents=True, git=git),
+            indexes,
+        )
+        pending = list(zip(indexes, diffs))
 
-        for path in to_process:
-            file_hash = diff.current_hashes[path]
-            symbols = self.__parser.parse_file(Path(path))
-            self.__storage.update_file(path, file_hash, symbols)
+        # outside a repository an existing store still has rows to save
+        head = git.head()
+        snapshots = CommitSnapshots.open(
+            self.__project, self.__limits, create=head is not None
+        )
+        try:
+            if snapshots is not None:
+                self.__rekey(snapshots, algorithm, zip(previous, rehashed))
+            self.__apply(
+                pending,
+                jobs,
+                batch_size or Storage.DEFAULT_BATCH_SIZE,
+                snapshots,
+            )
+            if snapshots is not None and head is not None:
+                self.__record(snapshots, head, pending, git.files())
+        finally:
+            if snapshots is not None:
+                snapshots.close()
+        return FileDiff.combine(diffs)
 
-        self.__storage.update_timestamp()
-        return self.__storage.get_all_symbols()
+    def update_paths(self, paths: Iterable[str]) -> FileDiff:
+        # targeted update for a known set of paths, used by watch mode
+        grouped: Dict[str, List[str]] = {}
+        for path in paths:
+            grouped.setdefault(self.__shards.for_path(path).name, []).append(
+                path
+            )
 
-    def diff_changes(self) -> FileDiff:
-        current_files = self.__scan_disk()
-        stored_files = self.__storage.get_file_hashes()
+        pending = [
+            (self.__indexes[name], self.__indexes[name].diff_paths(group))
+            for name, group in grouped.items()
+        ]
+        # rows a snapshot still needs are saved before they are replaced,
+        # the tree itself is only recorded by a full sync
+        snapshots = CommitSnapshots.open(
+            self.__project, self.__limits, create=False
+        )
+        try:
+            self.__apply(pending, 1, Storage.DEFAULT_BATCH_SIZE, snapshots)
+        finally:
+            if snapshots is not None:
+                snapshots.close()
+        return FileDiff.combine([diff for _, diff in pending])
 
-        current_paths = set(current_files.keys())
-        stored_paths = set(stored_files.keys())
+    def diff_changes(self, verify: bool = False) -> FileDiff:
+        git = GitRepository(self.__root)
+        diffs = fan_out(
+            lambda i: i.diff_changes(verify=verify, git=git),
+            list(self.__indexes.values()),
+        )
+        return FileDiff.combine(diffs)
 
-        added = current_paths - stored_paths
-        deleted = stored_paths - current_paths
-        modified = set()
+    def __apply(
+        self,
+        pending: List[Tuple["ShardIndex", FileDiff]],
+        jobs: Optional[int],
+        batch_size: int,
+        snapshots: Optional[CommitSnapshots] = None,
+    ) -> None:
+        # a shard without changes never opens a write transaction
+        timings = get_timings()
+        active = [(index, diff) for index, diff in pending if diff.changed]
+        owners: Dict[str, Tuple["ShardIndex", FileDiff]] = {}
+        contents: Dict[str, bytes] = {}
 
-        common_paths = current_paths.intersection(stored_paths)
-        for path in common_paths:
-            if current_files[path] != stored_files[path]:
-                modified.add(path)
+        if snapshots is not None:
+            with timings.phase("snapshot"):
+                self.__preserve(snapshots, active)
+
+        with ExitStack() as stack:
+            for index, diff in active:
+                storage = index.storage
+                stack.enter_context(storage.bulk_write(batch_size))
+
+                with timings.phase("write"):
+                    for path in diff.deleted:
+                        storage.remove_file(path)
+                timings.count("files_deleted", len(diff.deleted))
+
+                for path in diff.added | diff.modified:
+                    owners[path] = (index, diff)
+                contents.update(diff.contents)
+                diff.contents.clear()
+
+            results = self.__parse_cached(
+                sorted(owners), owners, contents, jobs, snapshots
+            )
+            while True:
+                # time spent waiting on the parser, serial or pooled
+                with timings.phase("parse"):
+                    item = next(results, None)
+                if item is None:
+                    break
+
+                path, result = item
+                index, diff = owners[path]
+                storage = index.storage
+                record = diff.current_files[path]
+
+                with timings.phase("write"):
+                    storage.update_file(
+                        path,
+                        record,
+                        result.symbols,
+                        result.references,
+                        result.sites,
+                        result.skipped,
+                    )
+
+            with timings.phase("write"):
+                for index, diff in active:
+                    for path in diff.touched:
+                        index.storage.update_file_stat(
+                            path, diff.current_files[path]
+                        )
 
-        return FileDiff(added, modified, deleted, current_files)
+        for index, _ in active:
+            index.storage.update_timestamp()
 
-    def __scan_disk(self) -> Dict[str, str]:
-        file_map: Dict[str, str] = {}
-        for path in self.__project.root.rglob("*.py"):
-            if self.__should_index(path):
-                file_map[str(path)] = self.__compute_hash(path)
-        return file_map
+    def __preserve(
+        self,
+        snapshots: CommitSnapshots,
+        active: List[Tuple["ShardIndex", FileDiff]],
+    ) -> None:
+        # rows of content a snapshot lists are copied out before they are
+        # replaced or deleted, once per content
+        timings = get_timings()
+        for index, diff in active:
+            storage = index.storage
+            keys: Dict[str, str] = {}
+            for path in diff.modified | diff.deleted:
+                record = storage.get_file_record(path)
+                if record is not None and record.file_hash:
+                    keys[path] = snapshots.key(
+                        index.hash_algorithm, record.file_hash, path
+                    )
 
-    def __compute_hash(self, file_path: Path) -> str:
-        hasher = hashlib.md5()
-        with open(file_path, "rb") as f:
-            while chunk := f.read(8192):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+            saved = []
+            for path, key in snapshots.missing(keys).items():
+                rows = storage.read_file(path)
+                if rows is not None:
+                    saved.append((key, ParseResult(*rows)))
+            snapshots.store(saved)
+            timings.count("snapshot_saved", len(saved))
 
-    def __should_index(self, path: Path) -> bool:
+    def __rekey(
+        self,
+        snapshots: CommitSnapshots,
+        algorithm: str,
+        rehashed: Iterable[Tuple[str, Dict[str, Tuple[str, str]]]],
+    ) -> None:
+        # keys embed the hash algorithm, content re-hashed in place keeps
+        # its snapshots under the new key
+        keys = {
+            snapshots.key(previous, old, path): snapshots.key(
+                algorithm, new, path
+            )
+            for previous, files in rehashed
+            for path, (old, new) in files.items()
+            if old
+        }
+        snapshots.rekey(keys)
+
+    def __record(
+        self,
+        snapshots: CommitSnapshots,
+        head: Tuple[str, str],
+        pending: List[Tuple["ShardIndex", FileDiff]],
+        files: Optional[GitFiles],
+    ) -> None:
+        # a snapshot lists the content of HEAD's tree only, files with
+        # staged or worktree changes and untracked ones are left out. the
+        # list is checked on every sync, so a tree first seen dirty or
+        # under another hash algorithm catches up
+        if files is None:
+            return
+
+        commit, tree = head
+        with get_timings().phase("snapshot"):
+            keys = [
+                snapshots.key(index.hash_algorithm, record.file_hash, path)
+                for index, diff in pending
+                for path, record in diff.current_files.items()
+                if record.file_hash
+                and path in files.clean
+                and path not in files.staged
+            ]
+            snapshots.record(commit, tree, keys)
+
+    def __parse_cached(
+        self,
+        paths: List[str],
+        owners: Dict[str, Tuple["ShardIndex", FileDiff]],
+        contents: Dict[str, bytes],
+        jobs: Optional[int],
+        snapshots: Optional[CommitSnapshots] = None,
+    ) -> Iterator[Tuple[str, ParseResult]]:
+        # content seen before is restored from a commit snapshot or taken
+        # from the user's parse cache, the rest is parsed and cached
+        timings = get_timings()
+
+        def counted(
+            results: Iterator[Tuple[str, ParseResult]],
+        ) -> Iterator[Tuple[str, ParseResult]]:
+            for path, result in results:
+                timings.count("files_parsed")
+                timings.count(
+                    "bytes_parsed", owners[path][1].current_files[path].size
+                )
+                yield path, result
+
+        cache = (
+            ParseCache.open(self.__limits)
+            if self.__parse_cache and paths
+            else None
+        )
+        stores = [store for store in (snapshots, cache) if store is not None]
+        if not stores or not paths:
+            yield from counted(self.__parse(paths, contents, jobs))
+            return
+
+        # both stores derive the same key from the same content
+        keys = {}
+        for path in paths:
+            index, diff = owners[path]
+            file_hash = diff.current_files[path].file_hash
+            keys[path] = stores[0].key(index.hash_algorithm, file_hash, path)
+
+        hits: Dict[str, ParseResult] = {}
+        if snapshots is not None:
+            with timings.phase("snapshot"):
+                hits = snapshots.get_many(keys)
+            timings.count("snapshot_hits", len(hits))
+        if cache is not None:
+            with timings.phase("cache"):
+                cached = cache.get_many(
+                    {p: k for p, k in keys.items() if p not in hits}
+                )
+            timings.count("cache_hits", len(cached))
+            hits.update(cached)
+        for path in hits:
+            contents.pop(path, None)
+
+        # both streams keep path order, so writes happen in the same
+        # sequence with or without the stores
+        misses = [path for path in paths if path not in hits]
+        parsed = counted(self.__parse(misses, contents, jobs))
+        pending: List[Tuple[str, ParseResult]] = []
         try:
-            rel_path = path.relative_to(self.__project.root)
-
-            if self.__ignore_spec.match_file(str(rel_path)):
-                return False
-            return True
-        except ValueError:
-            return False
-
-    def __load_ignore_spec(self) -> pathspec.PathSpec:
-        patterns = [
-            ".git",
-            ".atlas",
-            "__pycache__",
-            ".venv",
-            "venv",
-            "node_modules",
-            "*.pyc",
-            ".DS_Store",
+            for path in paths:
+                if path in hits:
+                    yield path, hits[path]
+                    continue
+
+                path, result = next(parsed)
+                if cache is not None and result.cacheable:
+                    pending.append((keys[path], result))
+                    if len(pending) >= self.__CACHE_BATCH:
+                        with timings.phase("cache"):
+                            cache.put_many(pending)
+                        pending = []
+                yield path, result
+        finally:
+            if cache is not None:
+                with timings.phase("cache"):
+                    cache.put_many(pending)
+                cache.close()
+
+    def __parse(
+        self,
+        paths: List[str],
+        contents: Dict[str, bytes],
+        jobs: Optional[int],
+    ) -> Iterator[Tuple[str, ParseResult]]:
+        workers = jobs if jobs is not None else os.cpu_count() or 1
+
+        # contents are popped as they are handed over so memory drains
+        if workers <= 1 or len(paths) < self.__PARALLEL_MIN_FILES:
+            for path in paths:
+                source = contents.pop(path, None)
+                yield path, self.__parser.parse_file(Path(path), source)
+            return
+
+        batches = []
+        for i in range(0, len(paths), self.__BATCH_SIZE):
+            chunk = paths[i : i + self.__BATCH_SIZE]
+            batches.append([(path, contents.pop(path, None)) for path in chunk])
+        workers = min(workers, len(batches))
+        timings = get_timings()
+        parse_batch = partial(
+            _parse_batch,
+            limits=self.__limits,
+            collect_timings=timings.enabled,
+        )
+
+        # map keeps input order so storage sees the same sequence as serial
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for results, worker_timings in pool.map(parse_batch, batches):
+                if worker_timings is not None:
+                    timings.merge(worker_timings)
+                yield from results
+
+
+class ShardIndex:
+    # change detection and storage for one shard
+    # hashlib drops the gil, threads overlap reads with hashing
+    __THREADED_MIN_FILES = 16
+
+    def __init__(
+        self, project: Project, shard: Shard, content_budget: int
+    ) -> None:
+        self.storage = Storage(project, shard)
+        self.__walker = Walker(
+            project, start=shard.path, excluded=shard.excluded
+        )
+        self.__hasher = Hasher(self.storage.get_hash_algorithm())
+        self.__content_budget = content_budget
+
+    @property
+    def hash_algorithm(self) -> str:
+        return self.__hasher.algorithm
+
+    def diff_paths(self, paths: Iterable[str]) -> FileDiff:
+        on_disk: Dict[str, os.stat_result] = {}
+        stored_files: Dict[str, FileRecord] = {}
+
+        for path in paths:
+            stored = self.storage.get_file_record(path)
+            if stored is not None:
+                stored_files[path] = stored
+
+            file_path = Path(path)
+            if not self.__walker.accepts(file_path):
+                continue
+            try:
+                on_disk[path] = file_path.stat()
+            except OSError:
+                continue
+
+        return self.__diff(on_disk, stored_files, verify=False)
+
+    def migrate_hashes(
+        self, algorithm: str, git: Optional[GitRepository] = None
+    ) -> Dict[str, Tuple[str, str]]:
+        # stored hashes only compare against the algorithm that made them.
+        # files with an unchanged stat tuple are re-hashed in place without
+        # re-parsing, the rest get a blank hash so the next diff re-parses.
+        # returns path -> (old hash, new hash) of the re-hashed files
+        rehashed: Dict[str, Tuple[str, str]] = {}
+        if algorithm == self.__hasher.algorithm:
+            return rehashed
+
+        hasher = Hasher(algorithm)
+        self.__hasher = hasher
+        stored_files = self.storage.get_file_records()
+        if not stored_files:
+            self.storage.set_hash_algorithm(algorithm)
+            return rehashed
+
+        timings = get_timings()
+        with timings.phase("walk"):
+            on_disk = self.__scan_disk()
+
+        unchanged = [
+            path
+            for path, record in stored_files.items()
+            if path in on_disk and record.same_stat(on_disk[path])
         ]
+        files = self.__git_files(hasher, git)
+        known = files.clean if files is not None else {}
+        hashed = self.__hash_files(hasher, unchanged, known)
+
+        with self.storage.bulk_write(Storage.DEFAULT_BATCH_SIZE):
+            for path in unchanged:
+                with timings.phase("hash"):
+                    file_hash, _ = next(hashed)
+                timings.count("git_ids" if path in known else "files_hashed")
+                record = stored_files.pop(path)
+                rehashed[path] = (record.file_hash, file_hash)
+                record.file_hash = file_hash
+                self.storage.update_file_stat(path, record)
+
+            for path, record in stored_files.items():
+                record.file_hash = ""
+                self.storage.update_file_stat(path, record)
+
+            self.storage.set_hash_algorithm(hasher.algorithm)
+        return rehashed
+
+    def diff_changes(
+        self,
+        verify: bool = False,
+        keep_contents: bool = False,
+        git: Optional[GitRepository] = None,
+    ) -> FileDiff:
+        timings = get_timings()
+        with timings.phase("walk"):
+            files = self.__git_files(self.__hasher, git)
+            if files is not None:
+                on_disk = self.__scan_git(files)
+            else:
+                on_disk = self.__scan_disk()
+        timings.count("files_scanned", len(on_disk))
+
+        with timings.phase("load_hashes"):
+            stored_files = self.storage.get_file_records()
+
+        # --verify still lists files through git but reads every one
+        known = files.clean if files is not None and not verify else {}
+        diff = self.__diff(on_disk, stored_files, verify, keep_contents, known)
+        diff.skipped = {
+            path: reason
+            for path, reason in self.storage.get_skipped_files().items()
+            if path in diff.current_files
+        }
+        return diff
+
+    def __git_files(
+        self, hasher: Hasher, git: Optional[GitRepository]
+    ) -> Optional[GitFiles]:
+        # stored ids are git blob ids only with the git algorithm, outside
+        # a repository it falls back to walking and hashing blobs locally
+        if git is None or hasher.algorithm != Hasher.GIT:
+            return None
+        return git.files()
 
-        gitignore_path = self.__project.root / ".gitignore"
-        if gitignore_path.exists():
+    def __diff(
+        self,
+        on_disk: Dict[str, os.stat_result],
+        stored_files: Dict[str, FileRecord],
+        verify: bool,
+        keep_contents: bool = True,
+        known: Optional[Dict[str, str]] = None,
+    ) -> FileDiff:
+        timings = get_timings()
+        current_files: Dict[str, FileRecord] = {}
+
+        added: Set[str] = set()
+        modified: Set[str] = set()
+        touched: Set[str] = set()
+
+        pending: List[str] = []
+        for path, st in on_disk.items():
+            stored = stored_files.get(path)
+
+            # unchanged stat tuple, trust the stored hash without reading
+            if stored is not None and not verify and stored.same_stat(st):
+                current_files[path] = stored
+                continue
+            pending.append(path)
+
+        contents: Dict[str, bytes] = {}
+        retained = 0
+        known = known or {}
+        hashed = self.__hash_files(self.__hasher, pending, known)
+
+        for path in pending:
+            with timings.phase("hash"):
+                file_hash, data = next(hashed)
+            st = on_disk[path]
+            if path in known:
+                timings.count("git_ids")
+            else:
+                timings.count("files_hashed")
+                timings.count("bytes_hashed", st.st_size)
+
+            record = FileRecord(
+                file_hash=file_hash,
+                size=st.st_size,
+                mtime_ns=st.st_mtime_ns,
+                inode=st.st_ino,
+            )
+            current_files[path] = record
+
+            stored = stored_files.get(path)
+            if stored is None:
+                added.add(path)
+            elif stored.file_hash != record.file_hash:
+                modified.add(path)
+            elif not stored.same_stat(st):
+                touched.add(path)
+
+            if path not in added and path not in modified:
+                continue
+            if (
+                keep_contents
+                and data is not None
+                and retained + len(data) <= self.__content_budget
+            ):
+                contents[path] = data
+                retained += len(data)
+
+        deleted = set(stored_files.keys()) - set(current_files.keys())
+
+        return FileDiff(
+            added, modified, deleted, touched, current_files, contents
+        )
+
+    def __scan_disk(self) -> Dict[str, os.stat_result]:
+        stat_map: Dict[str, os.stat_result] = {}
+        for entry in self.__walker.walk():
             try:
-                with open(gitignore_path, "r") as f:
-                    patterns.extend(f.read().splitlines())
-            except Exception:
-                pass
+                stat_map[entry.path] = entry.stat()
+            except OSError:
+                continue
+        return stat_map
+
+    def __scan_git(self, files: GitFiles) -> Dict[str, os.stat_result]:
+        # git already applied every ignore file, only the built-in names
+        # are left to check
+        extensions = self.__walker.extensions
+        stat_map: Dict[str, os.stat_result] = {}
+        for path in itertools.chain(files.clean, files.dirty, files.untracked):
+            if (
+                not path.endswith(extensions)
+                or not self.__walker.contains(path)
+                or self.__walker.is_default_ignored(path)
+            ):
+                continue
+            try:
+                stat_map[path] = os.stat(path)
+            except OSError:
+                continue
+        return stat_map
+
+    def __hash_files(
+        self, hasher: Hasher, paths: List[str], known: Dict[str, str]
+    ) -> Iterator[Tuple[str, Optional[bytes]]]:
+        # results come back in input order, reads overlap on cold caches.
+        # ids git already knows are never read
+        def identify(path: str) -> Tuple[str, Optional[bytes]]:
+            if path in known:
+                return known[path], None
+            return hasher.read(Path(path))
+
+        unknown = sum(1 for path in paths if path not in known)
+        if unknown < self.__THREADED_MIN_FILES:
+            yield from map(identify, paths)
+            return
 
-        return pathspec.PathSpec.from_lines("gitwildmatch", patterns)
+        with ThreadPoolExecutor() as pool:
+            yield from pool.map(identify, paths)
@@ -0,0 +1,23 @@
+from dataclasses import dataclass, fields
+from src.project import Project
+
+
+@dataclass
+class Limits:
+    # read from config.json {"limits": {...}}, 0 turns a limit off
+
+    # larger files are recorded as skipped, they are never parsed and only
+    # scanned for the names they use
+    max_file_bytes: int = 5 * 1024 * 1024
+    # seconds a single file may spend in the parser
+    parse_timeout: float = 10.0
+    # files with a generated code header only get their definitions
+    skip_generated: bool = True
+
+    __CONFIG_KEY = "limits"
+
+    @classmethod
+    def load(cls, project: Project) -> "Limits":
+        values = project.load_config().get(cls.__CONFIG_KEY, {})
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in values.items() if k in known})
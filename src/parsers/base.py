@@ -1,12 +1,41 @@
 from abc import ABC, abstractmethod
-from typing import List
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
 from pathlib import Path
-from src.storage import Symbol
+from src.storage import Site, Symbol
+
+
+@dataclass
+class ParseResult:
+    symbols: List[Symbol] = field(default_factory=list)
+    # identifiers the file refers to, drives unused symbol detection
+    references: Set[str] = field(default_factory=set)
+    # every place a name is called, accessed, imported or loaded
+    sites: List[Site] = field(default_factory=list)
+    # why the file was skipped or only partly indexed, empty when it was
+    # indexed in full
+    skipped: str = ""
+    # false when the outcome depends on the machine rather than the content
+    cacheable: bool = True
 
 
 class BaseParser(ABC):
     @abstractmethod
-    def parse_file(self, file_path: Path) -> List[Symbol]:
+    def parse_file(
+        self,
+        file_path: Path,
+        source: Optional[bytes] = None,
+        definitions_only: bool = False,
+    ) -> ParseResult:
+        # source is the file content when the caller already read it,
+        # definitions_only skips reference sites for a faster, partial
+        # result, the names a file uses are still reported
+        pass
+
+    @abstractmethod
+    def names(self, source: Optional[bytes]) -> Set[str]:
+        # every identifier the source could use, for files that are not
+        # parsed in full
         pass
 
     @property
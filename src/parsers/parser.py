@@ -1,22 +1,130 @@
+import os
+import re
+import signal
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Iterator, Optional
+from src.limits import Limits
+from src.parsers.base import ParseResult
 from src.parsers.python import PythonParser
-from src.storage import Symbol
+from src.timings import get_timings
+
+
+class ParseTimeout(BaseException):
+    # not an Exception, parsers catch those and must not swallow this
+    pass
 
 
 class Parser:
-    def __init__(self) -> None:
+    # bumped whenever parsers return something different for the same
+    # content, cached results of other versions are then never used
+    VERSION = 3
+    # markers tools put in a comment at the top of the files they write:
+    # @generated, go style "Code generated ... DO NOT EDIT" and protoc's
+    # header. only comment lines count, a docstring saying a module is
+    # auto-generated somewhere else is not a marker
+    __GENERATED = re.compile(
+        rb"^[ \t]*#.*?(?:@generated|do not edit"
+        rb"|generated by the protocol buffer compiler)",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    # only the header is searched, a marker further down is just text
+    __HEADER_LINES = 10
+    __HEADER_BYTES = 4096
+
+    def __init__(self, limits: Optional[Limits] = None) -> None:
+        self.__limits = limits or Limits()
         self.__parsers = [PythonParser()]
         self.__ext_map = {}
         for parser in self.__parsers:
             for ext in parser.extensions:
                 self.__ext_map[ext] = parser
 
-    def parse_file(self, file_path: Path) -> List[Symbol]:
+    def parse_file(
+        self, file_path: Path, source: Optional[bytes] = None
+    ) -> ParseResult:
         ext = file_path.suffix.lower()
         parser = self.__ext_map.get(ext)
 
         if parser is None:
-            return []
+            return ParseResult()
+
+        timings = get_timings()
+        limit = self.__limits.max_file_bytes
+        try:
+            size = len(source) if source is not None else None
+            if limit and size is None:
+                size = os.stat(file_path).st_size
+            if limit and size is not None and size > limit:
+                timings.count("files_skipped")
+                # never parsed, the names it uses still count
+                if source is None:
+                    with timings.phase("read"):
+                        source = file_path.read_bytes()
+                return ParseResult(
+                    references=parser.names(source),
+                    skipped=f"too large, {size} bytes",
+                )
+
+            if source is None:
+                with timings.phase("read"):
+                    source = file_path.read_bytes()
+        except OSError as e:
+            timings.count("files_skipped")
+            return ParseResult(
+                skipped=f"unreadable, {e.strerror}", cacheable=False
+            )
+
+        # generated files keep their definitions, their bodies are noise
+        # for references and usually the bulk of the parse
+        generated = self.__limits.skip_generated and self.__is_generated(source)
+        try:
+            with self.__deadline():
+                result = parser.parse_file(
+                    file_path, source, definitions_only=generated
+                )
+        except ParseTimeout:
+            timings.count("files_skipped")
+            return ParseResult(
+                references=parser.names(source),
+                skipped=f"timed out after {self.__limits.parse_timeout}s",
+                cacheable=False,
+            )
+
+        if generated and not result.skipped:
+            timings.count("files_generated")
+            result.skipped = "generated, definitions only"
+        elif result.skipped:
+            timings.count("files_skipped")
+        return result
+
+    def __is_generated(self, source: bytes) -> bool:
+        head = source[: self.__HEADER_BYTES].split(b"\n")
+        header = b"\n".join(head[: self.__HEADER_LINES])
+        return self.__GENERATED.search(header) is not None
+
+    @contextmanager
+    def __deadline(self) -> Iterator[None]:
+        # a real timer signal, so this only works on the main thread of a
+        # process, parser workers and the cli both are. ast.parse runs in
+        # c and is only interrupted once it returns, the size cap bounds it
+        seconds = self.__limits.parse_timeout
+        if (
+            not seconds
+            or not hasattr(signal, "setitimer")
+            or threading.current_thread() is not threading.main_thread()
+        ):
+            yield
+            return
+
+        def expire(signum, frame) -> None:
+            raise ParseTimeout()
 
-        return parser.parse_file(file_path)
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
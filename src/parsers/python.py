@@ -1,17 +1,224 @@
 import ast
+import math
+import re
+import time
 from pathlib import Path
-from typing import List
-from src.parsers.base import BaseParser
-from src.storage import Symbol
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type
+from src.parsers.base import BaseParser, ParseResult
+from src.storage import Site, Symbol
+from src.timings import get_timings
+
+
+class SignatureFormatter:
+    # ast.unparse builds a whole unparser per call, the usual shapes of
+    # names, dotted names, subscripts, unions and literals are written
+    # directly instead, byte for byte as unparse would, anything else
+    # still goes through unparse
+    def format(self, node: ast.FunctionDef) -> str:
+        args = self.__arguments(node.args)
+        if args is None:
+            args = ast.unparse(node.args)
+
+        returns = ""
+        if node.returns:
+            annotation = self.__expr(node.returns)
+            if annotation is None:
+                annotation = ast.unparse(node.returns)
+            returns = f"  -> {annotation}"
+        return f"({args}){returns}"
+
+    def __arguments(self, node: ast.arguments) -> Optional[str]:
+        parts: List[str] = []
+        positional = node.posonlyargs + node.args
+        defaults: List[Optional[ast.expr]] = [None] * (
+            len(positional) - len(node.defaults)
+        )
+        defaults.extend(node.defaults)
+        for index, (arg, default) in enumerate(zip(positional, defaults), 1):
+            part = self.__arg(arg, default)
+            if part is None:
+                return None
+            parts.append(part)
+            if index == len(node.posonlyargs):
+                parts.append("/")
+
+        if node.vararg or node.kwonlyargs:
+            star = "*"
+            if node.vararg:
+                vararg = self.__arg(node.vararg, None, "*")
+                if vararg is None:
+                    return None
+                star = vararg
+            parts.append(star)
+
+        for arg, default in zip(node.kwonlyargs, node.kw_defaults):
+            part = self.__arg(arg, default)
+            if part is None:
+                return None
+            parts.append(part)
+
+        if node.kwarg:
+            part = self.__arg(node.kwarg, None, "**")
+            if part is None:
+                return None
+            parts.append(part)
+        return ", ".join(parts)
+
+    def __arg(
+        self, arg: ast.arg, default: Optional[ast.expr], prefix: str = ""
+    ) -> Optional[str]:
+        text = f"{prefix}{arg.arg}"
+        if arg.annotation:
+            annotation = self.__expr(arg.annotation)
+            if annotation is None:
+                return None
+            text = f"{text}: {annotation}"
+        if default:
+            value = self.__expr(default)
+            if value is None:
+                return None
+            text = f"{text}={value}"
+        return text
+
+    def __expr(self, node: ast.expr) -> Optional[str]:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            if not isinstance(node.value, (ast.Name, ast.Attribute)):
+                return None
+            value = self.__expr(node.value)
+            return None if value is None else f"{value}.{node.attr}"
+        if isinstance(node, ast.Subscript):
+            return self.__subscript(node)
+        if isinstance(node, ast.Constant):
+            return self.__constant(node)
+        if isinstance(node, ast.BinOp):
+            # a | b | c nests to the left, a right operand union would
+            # need parentheses
+            if not isinstance(node.op, ast.BitOr) or isinstance(
+                node.right, ast.BinOp
+            ):
+                return None
+            left = self.__expr(node.left)
+            right = self.__expr(node.right)
+            if left is None or right is None:
+                return None
+            return f"{left} | {right}"
+        if isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, ast.USub) or not isinstance(
+                node.operand, ast.Constant
+            ):
+                return None
+            operand = self.__constant(node.operand)
+            return None if operand is None else f"-{operand}"
+        return None
+
+    def __subscript(self, node: ast.Subscript) -> Optional[str]:
+        if not isinstance(node.value, (ast.Name, ast.Attribute)):
+            return None
+        value = self.__expr(node.value)
+        items = node.slice
+        # unparse keeps the trailing comma of a one element tuple
+        if isinstance(items, ast.Tuple):
+            if len(items.elts) < 2:
+                return None
+            elements = [self.__expr(e) for e in items.elts]
+        else:
+            elements = [self.__expr(items)]
+        if value is None or None in elements:
+            return None
+        return f"{value}[{', '.join(elements)}]"  # type: ignore
+
+    def __constant(self, node: ast.Constant) -> Optional[str]:
+        value = node.value
+        if value is None or isinstance(value, bool):
+            return repr(value)
+        if value is ...:
+            return "..."
+        if type(value) is int:
+            return repr(value)
+        if type(value) is float and math.isfinite(value):
+            return repr(value)
+        # unparse picks its own quotes for anything needing escapes
+        if (
+            type(value) is str
+            and node.kind is None
+            and value.isascii()
+            and value.isprintable()
+            and "'" not in value
+            and "\\" not in value
+        ):
+            return f"'{value}'"
+        return None
 
 
 class SymbolVisitor(ast.NodeVisitor):
-    def __init__(self, file_path: Path) -> None:
+    # node type -> visit method, NodeVisitor.visit looks it up by name
+    # on every node
+    __handlers: Dict[Type[ast.AST], Callable] = {}
+    # node type -> fields that can hold nodes worth visiting, contexts
+    # and operators never contain names
+    __children: Dict[Type[ast.AST], Tuple[str, ...]] = {}
+    __LEAVES = (ast.expr_context, ast.boolop, ast.operator, ast.unaryop)
+    # nodes whose bodies can hold definitions
+    __BODIES = (ast.mod, ast.stmt, ast.excepthandler, ast.match_case)
+
+    def __init__(self, file_path: Path, definitions_only: bool = False) -> None:
         self.symbols: List[Symbol] = []
+        self.references: Set[str] = set()
+        self.sites: List[Site] = []
         self.file_path = str(file_path)
         # stack to trace class context
         # if len > 0 -> inside class
         self.__class_stack: List[str] = []
+        # enclosing classes and functions, joined into qualified names
+        self.__scope: List[str] = []
+        # parameters and assigned names of enclosing functions, loads of
+        # these are locals rather than references to project symbols
+        self.__locals: List[Set[str]] = []
+        self.__signatures = SignatureFormatter()
+        # only statements are walked, expressions hold no definitions
+        self.__definitions_only = definitions_only
+
+    def visit(self, node: ast.AST) -> None:
+        if self.__definitions_only and not isinstance(node, self.__BODIES):
+            return
+        handler = self.__handlers.get(type(node))
+        if handler is None:
+            handler = self.__handler(type(node))
+        handler(self, node)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        fields = self.__children.get(type(node))
+        if fields is None:
+            fields = self.__fields(type(node))
+        for name in fields:
+            value = getattr(node, name, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+
+    @classmethod
+    def __handler(cls, node_type: Type[ast.AST]) -> Callable:
+        handler = getattr(cls, f"visit_{node_type.__name__}", cls.generic_visit)
+        if issubclass(node_type, cls.__LEAVES) or not node_type._fields:
+            handler = cls.__skip
+        cls.__handlers[node_type] = handler
+        return handler
+
+    @classmethod
+    def __fields(cls, node_type: Type[ast.AST]) -> Tuple[str, ...]:
+        fields = tuple(
+            name for name in node_type._fields if name not in ("ctx", "op")
+        )
+        cls.__children[node_type] = fields
+        return fields
+
+    def __skip(self, node: ast.AST) -> None:
+        pass
 
     def visit_ClassDef(self, node: ast.ClassDef) -> None:
         self.symbols.append(
@@ -22,11 +229,14 @@ class SymbolVisitor(ast.NodeVisitor):
                 line_number=node.lineno,
                 signature="",
                 docstring=self.__get_docstring(node),
+                qualified_name=self.__qualify(node.name),
             )
         )
 
         self.__class_stack.append(node.name)
+        self.__scope.append(node.name)
         self.generic_visit(node)
+        self.__scope.pop()
         self.__class_stack.pop()
 
     def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
@@ -41,41 +251,181 @@ class SymbolVisitor(ast.NodeVisitor):
                 line_number=node.lineno,
                 signature=self.__get_signature(node),
                 docstring=self.__get_docstring(node),
+                qualified_name=self.__qualify(node.name),
             )
         )
 
+        self.__locals.append(self.__parameters(node.args))
+        self.__scope.append(node.name)
         self.generic_visit(node)
+        self.__scope.pop()
+        self.__locals.pop()
 
     def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
         self.visit_FunctionDef(node)  # type: ignore
 
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        self.__locals.append(self.__parameters(node.args))
+        self.generic_visit(node)
+        self.__locals.pop()
+
+    def visit_ListComp(self, node: ast.ListComp) -> None:
+        self.__visit_comprehension(node, node.elt)
+
+    def visit_SetComp(self, node: ast.SetComp) -> None:
+        self.__visit_comprehension(node, node.elt)
+
+    def visit_GeneratorExp(self, node: ast.GeneratorExp) -> None:
+        self.__visit_comprehension(node, node.elt)
+
+    def visit_DictComp(self, node: ast.DictComp) -> None:
+        self.__visit_comprehension(node, node.key, node.value)
+
+    def __visit_comprehension(self, node, *results: ast.expr) -> None:
+        # own scope, targets are bound before the element is evaluated
+        self.__locals.append(set())
+        for generator in node.generators:
+            self.visit(generator)
+        for result in results:
+            self.visit(result)
+        self.__locals.pop()
+
+    def visit_Call(self, node: ast.Call) -> None:
+        # the callee is recorded as a call rather than a plain load
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.references.add(func.id)
+            if not self.__is_local(func.id):
+                self.sites.append(
+                    (func.id, "call", func.lineno, func.col_offset)
+                )
+        elif isinstance(func, ast.Attribute):
+            self.references.add(func.attr)
+            self.sites.append((func.attr, "call", *self.__attr_position(func)))
+            self.visit(func.value)
+        else:
+            self.visit(func)
+
+        for arg in node.args:
+            self.visit(arg)
+        for keyword in node.keywords:
+            self.visit(keyword)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self.sites.append(
+                (alias.name, "import", alias.lineno, alias.col_offset)
+            )
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            self.sites.append(
+                (alias.name, "import", alias.lineno, alias.col_offset)
+            )
+
+    def visit_Name(self, node: ast.Name) -> None:
+        self.references.add(node.id)
+        if not isinstance(node.ctx, ast.Load):
+            if self.__locals:
+                self.__locals[-1].add(node.id)
+        elif not self.__is_local(node.id):
+            self.sites.append((node.id, "name", node.lineno, node.col_offset))
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        self.references.add(node.attr)
+        self.sites.append((node.attr, "attribute", *self.__attr_position(node)))
+        self.generic_visit(node)
+
+    def __is_local(self, name: str) -> bool:
+        for frame in self.__locals:
+            if name in frame:
+                return True
+        return False
+
+    def __parameters(self, args: ast.arguments) -> Set[str]:
+        names = {a.arg for a in (*args.posonlyargs, *args.args)}
+        names.update(a.arg for a in args.kwonlyargs)
+        for extra in (args.vararg, args.kwarg):
+            if extra is not None:
+                names.add(extra.arg)
+        return names
+
+    def __attr_position(self, node: ast.Attribute) -> Tuple[int, int]:
+        # points at the attribute name, not the start of the expression
+        line = node.end_lineno or node.lineno
+        column = (node.end_col_offset or 0) - len(node.attr)
+        return line, max(column, 0)
+
+    def __qualify(self, name: str) -> str:
+        return ".".join((*self.__scope, name))
+
     def __get_docstring(self, node) -> str:
         doc = ast.get_docstring(node)
         return doc.strip() if doc else ""
 
     def __get_signature(self, node: ast.FunctionDef) -> str:
-        args = ast.unparse(node.args)
-        returns = ""
-        if node.returns:
-            returns = f"  -> {ast.unparse(node.returns)}"
-        return f"({args}){returns}"
+        with get_timings().phase("signature"):
+            return self.__signatures.format(node)
 
 
 class PythonParser(BaseParser):
-    def parse_file(self, file_path: Path) -> List[Symbol]:
+    # identifiers anywhere in the source, strings and comments included,
+    # so a partly indexed file errs on the side of using a name
+    __IDENTIFIER = re.compile(rb"[A-Za-z_][A-Za-z0-9_]*")
+
+    def parse_file(
+        self,
+        file_path: Path,
+        source: Optional[bytes] = None,
+        definitions_only: bool = False,
+    ) -> ParseResult:
+        timings = get_timings()
+        start = time.perf_counter()
         try:
-            with open(file_path, "r") as f:
-                source = f.read()
+            if source is None:
+                with timings.phase("read"):
+                    with open(file_path, "rb") as f:
+                        source = f.read()
+
+            # bytes let ast honour the coding cookie and a utf-8 bom
 
-            tree = ast.parse(source, filename=str(file_path))
+            with timings.phase("ast_parse"):
+                tree = ast.parse(source, filename=str(file_path))
 
-            visitor = SymbolVisitor(file_path)
-            visitor.visit(tree)
+            # signature time is counted inside visit as well
+            with timings.phase("visit"):
+                visitor = SymbolVisitor(file_path, definitions_only)
+                visitor.visit(tree)
 
-            return visitor.symbols
-        except Exception:
-            return []
+            timings.count("symbols", len(visitor.symbols))
+            timings.count("reference_sites", len(visitor.sites))
+            # bodies were not visited, their names still count as used
+            references = (
+                self.names(source) if definitions_only else visitor.references
+            )
+            return ParseResult(visitor.symbols, references, visitor.sites)
+        except SyntaxError as e:
+            timings.count("parse_errors")
+            return ParseResult(
+                references=self.names(source),
+                skipped=f"syntax error, line {e.lineno}",
+            )
+        except Exception as e:
+            # deeply nested generated code can exhaust the recursion limit
+            timings.count("parse_errors")
+            return ParseResult(
+                references=self.names(source),
+                skipped=f"parse error, {type(e).__name__}",
+            )
+        finally:
+            timings.record_file(str(file_path), time.perf_counter() - start)
 
     @property
     def extensions(self) -> List[str]:
         return [".py"]
+
+    def names(self, source: Optional[bytes]) -> Set[str]:
+        # a regex pass is far cheaper than walking the bodies
+        with get_timings().phase("names"):
+            found = set(self.__IDENTIFIER.findall(source or b""))
+            return {name.decode("ascii") for name in found}
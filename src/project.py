@@ -1,20 +1,30 @@
+import json
 from pathlib import Path
+from typing import Dict, List, Optional
 
 
 class Project:
     __METADATA_DIR = ".atlas"
     __GITIGNORE_FILE = ".gitignore"
+    __CONFIG_FILE = "config.json"
 
     def __init__(self, root: Path) -> None:
         self.root = root.resolve()
         self.metadata_dir = self.root / self.__METADATA_DIR
+        self.config_path = self.metadata_dir / self.__CONFIG_FILE
 
     @classmethod
-    def init(cls, root: Path) -> None:
+    def init(cls, root: Path, shards: Optional[List[str]] = None) -> None:
         project = cls(root)
         project.metadata_dir.mkdir(exist_ok=True)
         project.__update_gitignore()
 
+        # re-running init only touches the shard layout when asked to
+        if shards is not None:
+            config = project.load_config()
+            config["shards"] = shards
+            project.save_config(config)
+
     @classmethod
     def load(cls, root: Path) -> "Project":
         project = cls(root)
@@ -22,6 +32,18 @@ class Project:
             raise FileNotFoundError(f"atlas not initialized in {root}")
         return project
 
+    def load_config(self) -> Dict:
+        try:
+            with open(self.config_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_config(self, config: Dict) -> None:
+        with open(self.config_path, "w") as f:
+            json.dump(config, f, indent=2)
+            f.write("\n")
+
     def __update_gitignore(self) -> None:
         gitignore_path = self.root / self.__GITIGNORE_FILE
         ignore_entry = ".atlas/"
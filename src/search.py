@@ -1,11 +1,138 @@
-from typing import List
+import heapq
+from itertools import islice
+from typing import Any, Callable, Iterator, List, Optional
 from src.project import Project
-from src.storage import Storage, Symbol
+from src.shards import Shards, fan_out
+from src.storage import Reference, Storage, Symbol
+
+# (storage, limit, offset) -> matches from that shard
+ShardQuery = Callable[[Storage, Optional[int], int], Iterator]
+
+
+# storage returns matches in id order and ids follow path and line, so
+# shards, whose ids are their own, are merged by path and line
+def _symbol_order(symbol: Symbol) -> Any:
+    return symbol.file_path, symbol.line_number
+
+
+def _reference_order(reference: Reference) -> Any:
+    return reference.file_path, reference.line_number, reference.column
 
 
 class Search:
-    def __init__(self, project: Project) -> None:
-        self.__storage = Storage(project)
+    def __init__(self, project: Project, read_only: bool = False) -> None:
+        self.__storages = [
+            Storage(project, shard, read_only=read_only)
+            for shard in Shards(project)
+        ]
+
+    def find(
+        self,
+        query: str,
+        partial: bool = False,
+        fuzzy: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> List[Symbol]:
+        return list(self.iter_find(query, partial, fuzzy, limit, offset, docs))
+
+    def iter_find(
+        self,
+        query: str,
+        partial: bool = False,
+        fuzzy: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> Iterator[Symbol]:
+        # docstrings are only read from the index when docs is set
+        if fuzzy:
+            return iter(self.__find_fuzzy(query, limit, offset, docs))
+        if partial or not any(c in query for c in ".:*"):
+            return self.__fan_out(
+                lambda storage, lim, off: storage.iter_find(
+                    query, partial=partial, limit=lim, offset=off, docs=docs
+                ),
+                limit,
+                offset,
+                _symbol_order,
+            )
+
+        # module:pattern restricts to one module, Class.* lists members,
+        # a trailing * is a prefix and a dotted name is a qualified name
+        module, _, pattern = query.rpartition(":")
+        if pattern in ("", "*"):
+            match = "all"
+        elif pattern.endswith(".*"):
+            match, pattern = "members", pattern[:-2]
+        elif pattern.endswith("*"):
+            match, pattern = "prefix", pattern[:-1]
+        else:
+            match = "exact"
+
+        return self.__fan_out(
+            lambda storage, lim, off: storage.iter_find_qualified(
+                pattern,
+                match=match,
+                module=module or None,
+                limit=lim,
+                offset=off,
+                docs=docs,
+            ),
+            limit,
+            offset,
+            _symbol_order,
+        )
+
+    def iter_references(
+        self,
+        name: str,
+        kind: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Iterator[Reference]:
+        return self.__fan_out(
+            lambda storage, lim, off: storage.iter_references(
+                name, kind=kind, limit=lim, offset=off
+            ),
+            limit,
+            offset,
+            _reference_order,
+        )
+
+    def __fan_out(
+        self,
+        query: ShardQuery,
+        limit: Optional[int],
+        offset: int,
+        order: Callable[[Any], Any],
+    ) -> Iterator:
+        if len(self.__storages) == 1:
+            return query(self.__storages[0], limit, offset)
+
+        # any shard may hold the whole page, so each returns up to
+        # offset + limit and the window is cut from the merged results.
+        # a file lives in one shard, equal keys never interleave shards
+        window = None if limit is None else offset + limit
+        parts = fan_out(
+            lambda storage: list(query(storage, window, 0)), self.__storages
+        )
+        return islice(heapq.merge(*parts, key=order), offset, window)
+
+    def __find_fuzzy(
+        self, query: str, limit: Optional[int], offset: int, docs: bool
+    ) -> List[Symbol]:
+        first = self.__storages[0]
+        if len(self.__storages) == 1:
+            return first.find_fuzzy(
+                query, limit=limit, offset=offset, docs=docs
+            )
 
-    def find(self, query: str, partial: bool = False) -> List[Symbol]:
-        return self.__storage.find(query, partial=partial)
+        window = (first.FUZZY_LIMIT if limit is None else limit) + offset
+        parts = fan_out(
+            lambda storage: storage.find_fuzzy(query, limit=window, docs=docs),
+            self.__storages,
+        )
+        candidates = [symbol for part in parts for symbol in part]
+        return first.rank_fuzzy(query, candidates, limit, offset)
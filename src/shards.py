@@ -0,0 +1,124 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, TypeVar
+from src.project import Project
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class Shard:
+    # subtree relative to the root, empty for the root shard
+    name: str
+    path: Path
+    # database file under the metadata dir, None is the main index.db
+    database: Optional[Path] = None
+    # nested shard roots, indexed by their own shard
+    excluded: List[Path] = field(default_factory=list)
+
+
+class Shards:
+    # config.json {"shards": ["packages/*", "services/api"]}, every
+    # matching directory gets its own database and the root shard keeps
+    # whatever is left, so an unsharded project is a single root shard
+    __CONFIG_KEY = "shards"
+    __DB_DIR = "shards"
+
+    def __init__(self, project: Project) -> None:
+        self.__root = project.root
+        self.__metadata_dir = project.metadata_dir
+        patterns = project.load_config().get(self.__CONFIG_KEY, [])
+        self.__shards = self.__resolve(project, patterns)
+
+    def __iter__(self) -> Iterator[Shard]:
+        return iter(self.__shards)
+
+    def __len__(self) -> int:
+        return len(self.__shards)
+
+    def prune(self) -> None:
+        # databases of shards dropped from the config are never read again
+        current = {
+            self.__metadata_dir / shard.database
+            for shard in self.__shards
+            if shard.database is not None
+        }
+        for database in (self.__metadata_dir / self.__DB_DIR).rglob("*.db"):
+            if database in current:
+                continue
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{database}{suffix}").unlink(missing_ok=True)
+
+    def for_path(self, file_path: str) -> Shard:
+        # the deepest shard containing the path owns it
+        owner = self.__shards[0]
+        for shard in self.__shards[1:]:
+            prefix = os.path.join(str(shard.path), "")
+            if file_path.startswith(prefix) and len(shard.name) > len(
+                owner.name
+            ):
+                owner = shard
+        return owner
+
+    def __resolve(self, project: Project, patterns: List[str]) -> List[Shard]:
+        root = Shard(name="", path=self.__root)
+        # the common unsharded case never loads the ignore rules, queries
+        # open shards on every run
+        if not patterns:
+            return [root]
+
+        from src.walker import Walker
+
+        walker = Walker(project)
+        paths = set()
+        for pattern in patterns:
+            for match in self.__root.glob(pattern):
+                if match == self.__root or not match.is_dir():
+                    continue
+                if not walker.is_ignored(match, is_dir=True):
+                    paths.add(match)
+
+        shards = [
+            Shard(
+                name=path.relative_to(self.__root).as_posix(),
+                path=path,
+                database=Path(
+                    self.__DB_DIR, f"{path.relative_to(self.__root)}.db"
+                ),
+            )
+            for path in sorted(paths)
+        ]
+        # root first, then by path, the order results are merged in
+        shards.insert(0, root)
+
+        for shard in shards:
+            shard.excluded = [
+                other.path
+                for other in shards
+                if other is not shard and self.__nearest(other, shards) is shard
+            ]
+        return shards
+
+    def __nearest(self, shard: Shard, shards: List[Shard]) -> Shard:
+        # closest enclosing shard, nested shards are only excluded by it
+        parent = shards[0]
+        for other in shards[1:]:
+            if other is not shard and other.path in shard.path.parents:
+                if len(other.name) > len(parent.name):
+                    parent = other
+        return parent
+
+
+def fan_out(func: Callable[[T], R], items: Sequence[T]) -> List[R]:
+    # sqlite, hashing and file reads drop the gil, so shards really run
+    # side by side, results come back in shard order
+    if len(items) <= 1:
+        return [func(item) for item in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = min(len(items), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, List
+from src.project import Project
+from src.shards import Shards
+from src.storage import Storage
+
+
+class Snapshot:
+    # a zip of vacuumed shard databases plus manifest.json, paths inside
+    # the databases are relative to the root and every file keeps its
+    # content hash, so the snapshot is valid in any checkout of the tree
+    FORMAT = 1
+    __MANIFEST = "manifest.json"
+    __MAIN_DB = "index.db"
+
+    def __init__(self, project: Project) -> None:
+        self.__project = project
+
+    def export(self, target: Path) -> Dict:
+        databases: List[Dict] = []
+        hash_algorithm = None
+
+        with (
+            tempfile.TemporaryDirectory() as tmp,
+            zipfile.ZipFile(
+                target, "w", compression=zipfile.ZIP_DEFLATED
+            ) as archive,
+        ):
+            for i, shard in enumerate(Shards(self.__project)):
+                name = (shard.database or Path(self.__MAIN_DB)).as_posix()
+                storage = Storage(self.__project, shard)
+                try:
+                    totals = storage.get_totals()
+                    hash_algorithm = hash_algorithm or (
+                        storage.get_hash_algorithm()
+                    )
+                    copy = os.path.join(tmp, f"{i}.db")
+                    storage.export(copy)
+                finally:
+                    storage.close()
+
+                archive.write(copy, name)
+                databases.append(
+                    {
+                        "shard": shard.name,
+                        "path": name,
+                        "files": totals.files,
+                        "symbols": totals.symbols,
+                    }
+                )
+
+            manifest = {
+                "format": self.FORMAT,
+                "created": int(time.time()),
+                "hash_algorithm": hash_algorithm,
+                "shards": self.__project.load_config().get("shards", []),
+                "databases": databases,
+            }
+            archive.writestr(self.__MANIFEST, json.dumps(manifest, indent=2))
+        return manifest
+
+    def restore(self, source: Path) -> Dict:
+        metadata_dir = self.__project.metadata_dir
+
+        with zipfile.ZipFile(source) as archive:
+            manifest = self.__read_manifest(archive)
+            paths = [entry["path"] for entry in manifest["databases"]]
+
+            # only the databases are replaced, the config keeps its other
+            # settings
+            for suffix in ("", "-wal", "-shm"):
+                (metadata_dir / f"{self.__MAIN_DB}{suffix}").unlink(
+                    missing_ok=True
+                )
+            shutil.rmtree(metadata_dir / "shards", ignore_errors=True)
+
+            for path in paths:
+                database = metadata_dir / path
+                database.parent.mkdir(parents=True, exist_ok=True)
+                with archive.open(path) as src, open(database, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+
+        config = self.__project.load_config()
+        if manifest["shards"]:
+            config["shards"] = manifest["shards"]
+        else:
+            config.pop("shards", None)
+        self.__project.save_config(config)
+
+        # opening migrates an older schema, and stat info from the
+        # exporting machine is dropped so the next index goes by hashes
+        for shard in Shards(self.__project):
+            storage = Storage(self.__project, shard)
+            try:
+                storage.forget_stats()
+            finally:
+                storage.close()
+        return manifest
+
+    def __read_manifest(self, archive: zipfile.ZipFile) -> Dict:
+        try:
+            manifest = json.loads(archive.read(self.__MANIFEST))
+        except KeyError:
+            raise ValueError("not an atlas snapshot, manifest.json missing")
+
+        version = manifest.get("format")
+        if not isinstance(version, int) or version > self.FORMAT:
+            raise ValueError(
+                f"snapshot format {version} is newer than this atlas supports"
+            )
+
+        members = set(archive.namelist())
+        for entry in manifest.get("databases", []):
+            path = PurePosixPath(entry["path"])
+            # extracted under .atlas only, never above it
+            if path.is_absolute() or ".." in path.parts:
+                raise ValueError(f"unsafe database path in snapshot: {path}")
+            if path.suffix != ".db" or entry["path"] not in members:
+                raise ValueError(f"snapshot is missing {path}")
+        if not manifest.get("databases"):
+            raise ValueError("snapshot contains no databases")
+        return manifest
@@ -2,7 +2,8 @@ from dataclasses import dataclass
 from typing import Dict, List, Tuple
 
 from src.project import Project
-from src.storage import Storage
+from src.shards import Shards, fan_out
+from src.storage import IndexTotals, Storage
 
 
 @dataclass
@@ -15,22 +16,35 @@ class CodebaseStats:
 
 
 class Stats:
-    def __init__(self, project: Project) -> None:
-        self.__storage = Storage(project)
+    def __init__(self, project: Project, read_only: bool = False) -> None:
+        self.__storages = [
+            Storage(project, shard, read_only=read_only)
+            for shard in Shards(project)
+        ]
 
     def generate(self, limit: int = 5) -> CodebaseStats:
+        totals = IndexTotals.combine(
+            fan_out(Storage.get_totals, self.__storages)
+        )
         return CodebaseStats(
-            total_files=self.__storage.get_file_count(),
-            total_symbols=self.__storage.get_total_symbol_count(),
-            docstring_coverage=self.__calculate_coverage(),
-            type_distribution=self.__storage.get_symbol_counts_by_type(),
-            top_files=self.__storage.get_top_files_by_symbol_count(limit),
+            total_files=totals.files,
+            total_symbols=totals.symbols,
+            docstring_coverage=self.__calculate_coverage(totals),
+            type_distribution=totals.by_type,
+            top_files=self.__top_files(limit),
+        )
+
+    def __top_files(self, limit: int) -> List[Tuple[str, int]]:
+        # each shard's top n holds the global top n between them, the
+        # stable sort keeps shard order on ties
+        parts = fan_out(
+            lambda st: st.get_top_files_by_symbol_count(limit), self.__storages
         )
+        merged = [item for part in parts for item in part]
+        return sorted(merged, key=lambda item: -item[1])[:limit]
 
-    def __calculate_coverage(self) -> float:
-        total = self.__storage.get_total_symbol_count()
-        if total == 0:
+    def __calculate_coverage(self, totals: IndexTotals) -> float:
+        if totals.symbols == 0:
             return 0.0
 
-        documented = self.__storage.get_documented_symbol_count()
-        return round((documented / total) * 100, 1)
+        return round((totals.documented / totals.symbols) * 100, 1)
@@ -1,9 +1,28 @@
+import heapq
+import os
 import sqlite3
+import zlib
+from collections import Counter
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from src.fuzzy import Fuzzy
+from src.hashing import Hasher
 from src.project import Project
+from src.shards import Shard
+from src.timings import get_timings
 from datetime import datetime
 
+# the order doubles as the stored type code and the fuzzy tie-break,
+# most likely meant first
+SYMBOL_TYPES = ("class", "function", "method")
+# same idea for reference sites
+REFERENCE_KINDS = ("call", "attribute", "import", "name")
+
+# (name, kind, line, column) as the parser records it, tuples keep the
+# results sent back from parser processes small
+Site = Tuple[str, str, int, int]
+
 
 @dataclass
 class Symbol:
@@ -13,133 +32,1322 @@ class Symbol:
     line_number: int
     signature: str = ""
     docstring: str = ""
+    # dotted path of enclosing classes and functions, Storage.find
+    qualified_name: str = ""
+
+
+@dataclass
+class Reference:
+    name: str
+    kind: str  # call, attribute, import, name
+    file_path: str
+    line_number: int
+    column: int = 0
+
+
+@dataclass
+class IndexTotals:
+    files: int
+    symbols: int
+    documented: int
+    by_type: Dict[str, int]
+
+    @classmethod
+    def combine(cls, totals: List["IndexTotals"]) -> "IndexTotals":
+        by_type: Dict[str, int] = {}
+        for name in SYMBOL_TYPES:
+            count = sum(part.by_type.get(name, 0) for part in totals)
+            if count:
+                by_type[name] = count
+        return cls(
+            files=sum(part.files for part in totals),
+            symbols=sum(part.symbols for part in totals),
+            documented=sum(part.documented for part in totals),
+            by_type=by_type,
+        )
+
+
+@dataclass
+class FileRecord:
+    file_hash: str
+    size: int = 0
+    mtime_ns: int = 0
+    inode: int = 0
+
+    def same_stat(self, st: os.stat_result) -> bool:
+        return (
+            self.size == st.st_size
+            and self.mtime_ns == st.st_mtime_ns
+            and self.inode == st.st_ino
+        )
 
 
 class Storage:
     __DB_FILE = "index.db"
+    DEFAULT_BATCH_SIZE = 500
+    # types are stored as small ints
+    __TYPE_CODES = {name: code for code, name in enumerate(SYMBOL_TYPES)}
+    __TYPE_NAMES = {code: name for name, code in __TYPE_CODES.items()}
+    __KIND_CODES = {name: code for code, name in enumerate(REFERENCE_KINDS)}
+    __SYMBOL_COLUMNS = """
+        s.name, s.type, f.path, s.line_number, s.signature, s.qualname
+    """
+    # docstrings live compressed in their own table and are only read
+    # when a caller asks for them
+    __DOCSTRING_COLUMN = """
+        (SELECT d.text FROM docstrings d WHERE d.symbol_id = s.id)
+    """
+    # rows pulled from sqlite per round trip while streaming results
+    __FETCH_SIZE = 256
+    FUZZY_LIMIT = 20
+    # names per IN (...) list, well below sqlite's variable limit
+    __IN_CHUNK = 500
+    # bumped whenever __create_schema changes what it builds, read only
+    # connections cannot migrate so they require the current version
+    __SCHEMA_VERSION = 4
+    # read only connections map up to this much of the file
+    __MMAP_SIZE = 1024 * 1024 * 1024
+
+    def __init__(
+        self,
+        project: Project,
+        shard: Optional[Shard] = None,
+        read_only: bool = False,
+    ) -> None:
+        database = shard.database if shard is not None else None
+        self.__db_path = project.metadata_dir / (database or self.__DB_FILE)
+        self.__db_path.parent.mkdir(parents=True, exist_ok=True)
+        # paths are stored relative to the root, callers see absolute ones
+        self.__root = str(project.root)
+        self.__prefix = os.path.join(self.__root, "")
+        # None -> commit after every write, otherwise files per transaction
+        self.__batch_size: Optional[int] = None
+        self.__pending = 0
+        self.__has_trigrams = False
+        self.__fuzzy = Fuzzy()
+        # per name symbol count changes of the open transaction, written
+        # together right before it commits
+        self.__fuzzy_deltas: Counter = Counter()
+
+        # read only is best effort, anything it cannot serve opens the
+        # regular way, which also brings an old schema up to date
+        conn = self.__open_read_only() if read_only else None
+        if conn is not None:
+            self.__conn = conn
+            return
 
-    def __init__(self, project: Project) -> None:
-        self.__db_path = project.metadata_dir / self.__DB_FILE
-        self.__conn = sqlite3.connect(self.__db_path)
+        # shard fan-out hands a connection to a worker thread, each
+        # connection is still only used by one thread at a time
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__configure()
         self.__create_schema()
 
+    def __open_read_only(self) -> Optional[sqlite3.Connection]:
+        # immutable skips locking and change detection, which is only safe
+        # while nothing writes, a non-empty wal means a writer is or was
+        # active and its pages would be missed
+        wal = self.__db_path.with_name(f"{self.__db_path.name}-wal")
+        if not self.__db_path.exists() or (
+            wal.exists() and wal.stat().st_size > 0
+        ):
+            return None
+
+        conn = sqlite3.connect(
+            f"{self.__db_path.as_uri()}?mode=ro&immutable=1",
+            uri=True,
+            check_same_thread=False,
+        )
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"PRAGMA mmap_size = {self.__MMAP_SIZE}")
+            cursor.execute(
+                "SELECT value FROM metadata WHERE key = 'schema_version'"
+            )
+            row = cursor.fetchone()
+            if row is None or int(row[0]) != self.__SCHEMA_VERSION:
+                conn.close()
+                return None
+
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'symbol_trigrams'"
+            )
+            if cursor.fetchone() is not None:
+                # raises when this sqlite lacks fts5
+                cursor.execute("SELECT 1 FROM symbol_trigrams LIMIT 0")
+                self.__has_trigrams = True
+        except sqlite3.Error:
+            conn.close()
+            return None
+        return conn
+
+    def __configure(self) -> None:
+        cursor = self.__conn.cursor()
+        # wal + normal sync never corrupts, at worst loses the last commit
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        # negative size is in KiB, 64 MiB page cache
+        cursor.execute("PRAGMA cache_size = -65536")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+
     def __create_schema(self) -> None:
         cursor = self.__conn.cursor()
 
+        # metadata table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        legacy = self.__detach_legacy_tables(cursor)
+
+        # one row per indexed file, everything else refers to its id
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                module TEXT,
+                file_hash TEXT,
+                size INTEGER DEFAULT 0,
+                mtime_ns INTEGER DEFAULT 0,
+                inode INTEGER DEFAULT 0
+            )
+        """)
+
         # symbols table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS symbols (
-                name TEXT,
-                type TEXT,
-                file_path TEXT,
+                id INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                name TEXT NOT NULL,
+                qualname TEXT,
+                type INTEGER NOT NULL,
                 line_number INTEGER,
                 signature TEXT,
-                docstring TEXT
+                has_docstring INTEGER NOT NULL DEFAULT 0
             )
         """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_name ON symbols(name)")
         cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_file ON symbols(file_path)"
+            "CREATE INDEX IF NOT EXISTS idx_symbol_name ON symbols(name)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_symbol_file ON symbols(file_id)"
         )
 
-        # metadata table
+        # distinct identifiers each file refers to
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS metadata (
-                key TEXT PRIMARY KEY,
-                value TEXT
+            CREATE TABLE IF NOT EXISTS used_names (
+                name TEXT,
+                file_id INTEGER,
+                PRIMARY KEY (name, file_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_used_file ON used_names(file_id)"
+        )
+
+        moved = self.__create_docstrings(cursor)
+        if legacy:
+            self.__migrate_legacy_rows(cursor)
+
+        self.__create_scopes(cursor)
+        self.__create_references(cursor)
+        self.__create_file_stats(cursor)
+        self.__create_skipped_files(cursor)
+        self.__record_hash_algorithm(cursor)
+        self.__create_trigram_index(cursor)
+        rebuilt = self.__create_fuzzy_index(cursor)
+        # an up to date index is opened without a single write, queries
+        # never take the write lock
+        cursor.execute(
+            "SELECT value FROM metadata WHERE key = 'schema_version'"
+        )
+        row = cursor.fetchone()
+        if row is None or row[0] != str(self.__SCHEMA_VERSION):
+            cursor.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                ("schema_version", str(self.__SCHEMA_VERSION)),
             )
+
+        if self.__conn.in_transaction:
+            self.__conn.commit()
+
+        if legacy or moved or rebuilt:
+            # give the space of the old tables and columns back
+            cursor.execute("VACUUM")
+
+    def __detach_legacy_tables(self, cursor: sqlite3.Cursor) -> bool:
+        # indexes before integer file ids keyed every table by the absolute
+        # path, move them aside so the new tables can take their names
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_hashes'")
+        if cursor.fetchone() is None:
+            return False
+
+        # ddl would otherwise autocommit, the whole move is one transaction
+        cursor.execute("BEGIN")
+        # the trigram table points at the old symbols, it is rebuilt later
+        cursor.execute("DROP TABLE IF EXISTS symbol_trigrams")
+        cursor.execute("ALTER TABLE symbols RENAME TO legacy_symbols")
+
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'used_names'")
+        if cursor.fetchone() is not None:
+            cursor.execute("ALTER TABLE used_names RENAME TO legacy_used_names")
+        return True
+
+    def __migrate_legacy_rows(self, cursor: sqlite3.Cursor) -> None:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'legacy_used_names'"
+        )
+        has_references = cursor.fetchone() is not None
+
+        # stat columns arrived after the hash, zeroed stats force a re-hash
+        cursor.execute("PRAGMA table_info(file_hashes)")
+        columns = {row[1] for row in cursor.fetchall()}
+        stats = ", ".join(
+            column if column in columns else "0"
+            for column in ("size", "mtime_ns", "inode")
+        )
+        cursor.execute(
+            f"SELECT file_path, file_hash, {stats} "
+            f"FROM file_hashes ORDER BY file_path"
+        )
+
+        file_ids: Dict[str, int] = {}
+        for file_path, *values in cursor.fetchall():
+            if not has_references:
+                # references were never recorded, blank the hash and stats
+                # so the next index run re-parses every file
+                values = ["", 0, 0, 0]
+            record = FileRecord(*values)
+            file_ids[file_path] = self.__write_record(cursor, file_path, record)
+
+        cursor.execute("""
+            SELECT file_path, name, type, line_number, signature, docstring
+            FROM legacy_symbols ORDER BY rowid
         """)
+        rows = [row for row in cursor.fetchall() if row[0] in file_ids]
+        # ids are given out here so the docstrings can refer to them
+        cursor.executemany(
+            """
+            INSERT INTO symbols (
+                id, file_id, name, type, line_number, signature, has_docstring
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (i, file_ids[row[0]], row[1], self.__TYPE_CODES[row[2]])
+                + (row[3], row[4], bool(row[5]))
+                for i, row in enumerate(rows, 1)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO docstrings (symbol_id, text) VALUES (?, ?)",
+            [
+                (i, self.__compress(row[5]))
+                for i, row in enumerate(rows, 1)
+                if row[5]
+            ],
+        )
 
-        # file_hashes table
+        if has_references:
+            cursor.execute("SELECT file_path, name FROM legacy_used_names")
+            cursor.executemany(
+                """
+                INSERT OR IGNORE INTO used_names (name, file_id)
+                VALUES (?, ?)
+            """,
+                [
+                    (name, file_ids[file_path])
+                    for file_path, name in cursor.fetchall()
+                    if file_path in file_ids
+                ],
+            )
+            cursor.execute("DROP TABLE legacy_used_names")
+
+        cursor.execute("DROP TABLE legacy_symbols")
+        cursor.execute("DROP TABLE file_hashes")
+
+    def __create_docstrings(self, cursor: sqlite3.Cursor) -> bool:
+        # zlib compressed text keyed by symbol, rows only for symbols that
+        # have a docstring
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS file_hashes (
-                file_path TEXT PRIMARY KEY,
-                file_hash TEXT
+            CREATE TABLE IF NOT EXISTS docstrings (
+                symbol_id INTEGER PRIMARY KEY,
+                text BLOB NOT NULL
             )
         """)
 
-        self.__conn.commit()
+        # indexes before the split kept the text inline, move it out
+        cursor.execute("PRAGMA table_info(symbols)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "has_docstring" not in columns:
+            cursor.execute("""
+                ALTER TABLE symbols
+                ADD COLUMN has_docstring INTEGER NOT NULL DEFAULT 0
+            """)
+        if "docstring" not in columns:
+            return False
 
-    def find(self, query: str, partial: bool = False) -> List[Symbol]:
-        cursor = self.__conn.cursor()
+        cursor.execute(
+            "SELECT id, docstring FROM symbols WHERE docstring IS NOT NULL"
+        )
+        rows = cursor.fetchall()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO docstrings (symbol_id, text) VALUES (?, ?)",
+            [
+                (symbol_id, self.__compress(text))
+                for symbol_id, text in rows
+                if text
+            ],
+        )
+        cursor.execute(
+            "UPDATE symbols SET has_docstring = 1 WHERE docstring != ''"
+        )
+        try:
+            cursor.execute("ALTER TABLE symbols DROP COLUMN docstring")
+        except sqlite3.OperationalError:
+            # drop column needs sqlite 3.35, empty the column instead, new
+            # rows leave it NULL so the move is not repeated
+            cursor.execute("UPDATE symbols SET docstring = NULL")
+        return bool(rows)
+
+    def __compress(self, text: str) -> bytes:
+        return zlib.compress(text.encode("utf-8"))
+
+    def __decompress(self, data: Optional[bytes]) -> str:
+        return zlib.decompress(data).decode("utf-8") if data else ""
+
+    def __create_fuzzy_index(self, cursor: sqlite3.Cursor) -> bool:
+        # indexes before schema 4 stored the variants of every name along
+        # with its full text, they are dropped and rebuilt per prefix
+        cursor.execute("PRAGMA table_info(fuzzy_terms)")
+        columns = {row[1] for row in cursor.fetchall()}
+        stale = bool(columns) and "term" not in columns
+        if stale:
+            cursor.execute("DROP TABLE fuzzy_deletes")
+            cursor.execute("DROP TABLE fuzzy_terms")
+
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'fuzzy_terms'")
+        exists = cursor.fetchone() is not None
 
-        if partial:
+        # distinct name prefixes with the number of names sharing them,
+        # variants only depend on the prefix so they are stored once each
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fuzzy_terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE,
+                refs INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fuzzy_names (
+                term_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (term_id, name)
+            ) WITHOUT ROWID
+        """)
+        # deletion variants of each prefix
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fuzzy_deletes (
+                variant TEXT NOT NULL,
+                term_id INTEGER NOT NULL,
+                PRIMARY KEY (variant, term_id)
+            ) WITHOUT ROWID
+        """)
+
+        if not exists:
+            cursor.execute("SELECT name, COUNT(*) FROM symbols GROUP BY name")
+            with get_timings().phase("fuzzy_index"):
+                self.__apply_fuzzy(cursor, Counter(dict(cursor.fetchall())))
+        return stale
+
+    def __create_trigram_index(self, cursor: sqlite3.Cursor) -> None:
+        # fts5 over symbols.name so substring search is an index lookup
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'symbol_trigrams'"
+        )
+        exists = cursor.fetchone() is not None
+
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS symbol_trigrams USING fts5(
+                    name,
+                    content='symbols',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError:
+            # sqlite built without fts5 or older than 3.34, scan with LIKE
+            return
+
+        if not exists:
+            # index predates the trigram table, backfill from symbols
+            cursor.execute("""
+                INSERT INTO symbol_trigrams(symbol_trigrams) VALUES ('rebuild')
+            """)
+
+        self.__has_trigrams = True
+
+    def __create_scopes(self, cursor: sqlite3.Cursor) -> None:
+        # indexes before qualified names lack the columns, add them
+        for table, column, kind in (
+            ("files", "module", "TEXT"),
+            ("symbols", "parent_id", "INTEGER"),
+            ("symbols", "qualname", "TEXT"),
+        ):
+            cursor.execute(f"PRAGMA table_info({table})")
+            if column not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {kind}"
+                )
+
+        cursor.execute("SELECT id, path FROM files WHERE module IS NULL")
+        cursor.executemany(
+            "UPDATE files SET module = ? WHERE id = ?",
+            [(self.__module(path), file_id) for file_id, path in cursor],
+        )
+
+        cursor.execute("SELECT 1 FROM symbols WHERE qualname IS NULL LIMIT 1")
+        if cursor.fetchone() is not None:
+            # scopes only come from parsing, bare names keep lookups
+            # working and blank hashes make the next run re-parse
+            cursor.execute(
+                "UPDATE symbols SET qualname = name WHERE qualname IS NULL"
+            )
+            cursor.execute("""
+                UPDATE files
+                SET file_hash = '', size = 0, mtime_ns = 0, inode = 0
+            """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_symbol_qualname
+            ON symbols(qualname)
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_symbol_parent ON symbols(parent_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_files_module ON files(module)"
+        )
+
+    def __create_references(self, cursor: sqlite3.Cursor) -> None:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'refs'")
+        exists = cursor.fetchone() is not None
+
+        # every reference site, clustered by file so a re-index replaces a
+        # contiguous range, the name index covers lookups in file order
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS refs (
+                file_id INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                col INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                kind INTEGER NOT NULL,
+                PRIMARY KEY (file_id, line, col, name, kind)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_refs_name ON refs(name)")
+
+        if not exists:
+            # sites only come from parsing, blank hashes make the next run
+            # re-parse what an older index already holds
+            cursor.execute("""
+                UPDATE files
+                SET file_hash = '', size = 0, mtime_ns = 0, inode = 0
+            """)
+
+    def __create_file_stats(self, cursor: sqlite3.Cursor) -> None:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_stats'")
+        exists = cursor.fetchone() is not None
+
+        # per file aggregates kept in step with symbols, stats reads these
+        # instead of scanning every symbol
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS file_stats (
+                file_id INTEGER PRIMARY KEY,
+                symbol_count INTEGER NOT NULL,
+                class_count INTEGER NOT NULL,
+                function_count INTEGER NOT NULL,
+                method_count INTEGER NOT NULL,
+                documented_count INTEGER NOT NULL
+            )
+        """)
+        # matches the hotspot ordering, ties go to the older file
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_file_stats_count
+            ON file_stats(symbol_count DESC, file_id)
+        """)
+
+        if not exists:
+            cursor.execute("""
+                INSERT INTO file_stats
+                SELECT
+                    f.id,
+                    COUNT(s.id),
+                    COALESCE(SUM(s.type = 0), 0),
+                    COALESCE(SUM(s.type = 1), 0),
+                    COALESCE(SUM(s.type = 2), 0),
+                    COALESCE(SUM(s.has_docstring), 0)
+                FROM files f LEFT JOIN symbols s ON s.file_id = f.id
+                GROUP BY f.id
+            """)
+
+    def __create_skipped_files(self, cursor: sqlite3.Cursor) -> None:
+        # files the parser skipped or only partly indexed, and why
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS skipped_files (
+                file_id INTEGER PRIMARY KEY,
+                reason TEXT NOT NULL
+            )
+        """)
+
+    def __record_hash_algorithm(self, cursor: sqlite3.Cursor) -> None:
+        # only written when missing, so opening a recorded index never
+        # starts a write. indexes that predate the setting used md5
+        cursor.execute("SELECT 1 FROM metadata WHERE key = 'hash_algorithm'")
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute("SELECT 1 FROM files LIMIT 1")
+        algorithm = Hasher.LEGACY if cursor.fetchone() else Hasher.DEFAULT
+        cursor.execute(
+            "INSERT INTO metadata (key, value) VALUES (?, ?)",
+            ("hash_algorithm", algorithm),
+        )
+
+    def find(
+        self,
+        query: str,
+        partial: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> List[Symbol]:
+        return list(self.iter_find(query, partial, limit, offset, docs))
+
+    def iter_find(
+        self,
+        query: str,
+        partial: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> Iterator[Symbol]:
+        # every plan walks symbols in id order without a sort, so the first
+        # row arrives before the last match is found and pages are stable.
+        # a run writes files in path order and symbols in line order, so
+        # ids of files written together follow path and line
+        if partial and self.__has_trigrams:
+            # trigram LIKE narrows the candidates, the outer LIKE keeps
+            # results identical to a plain scan
+            sql = f"""
+                SELECT {self.__columns(docs)}
+                FROM symbol_trigrams t
+                JOIN symbols s ON s.id = t.rowid
+                JOIN files f ON f.id = s.file_id
+                WHERE t.name LIKE ? AND s.name LIKE ?
+                ORDER BY t.rowid
+            """
+            pattern = f"%{query}%"
+            params: Tuple = (pattern, pattern)
+        elif partial:
             # sqlite LIKE is case-insensitive by default
-            sql = "SELECT * FROM symbols WHERE name LIKE ?"
-            cursor.execute(sql, (f"%{query}%",))
+            sql = f"""
+                {self.__select(docs)} WHERE s.name LIKE ?
+                ORDER BY s.id
+            """
+            params = (f"%{query}%",)
         else:
-            sql = "SELECT * FROM symbols WHERE name = ?"
-            cursor.execute(sql, (query,))
+            sql = f"""
+                {self.__select(docs)} WHERE s.name = ?
+                ORDER BY s.id
+            """
+            params = (query,)
 
-        return [Symbol(*row) for row in cursor.fetchall()]
+        # a negative limit is no limit to sqlite
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            f"{sql} LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset),
+        )
+        while rows := cursor.fetchmany(self.__FETCH_SIZE):
+            for row in rows:
+                yield self.__to_symbol(row)
+
+    def iter_find_qualified(
+        self,
+        pattern: str,
+        match: str = "exact",
+        module: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> Iterator[Symbol]:
+        # match is exact, prefix, members (direct children through the
+        # parent link) or all, dotted patterns compare the qualified name
+        column = "qualname" if "." in pattern else "name"
+        conditions: List[str] = []
+        params: List = []
 
-    def get_file_hashes(self) -> Dict[str, str]:
+        if module is not None:
+            conditions.append("f.module = ?")
+            params.append(module)
+
+        if match == "exact":
+            conditions.append(f"s.{column} = ?")
+            params.append(pattern)
+        elif match == "prefix" and pattern:
+            # a range keeps the seek on the index, LIKE would not
+            upper = pattern[:-1] + chr(ord(pattern[-1]) + 1)
+            conditions.append(f"s.{column} >= ? AND s.{column} < ?")
+            params.extend((pattern, upper))
+        elif match == "members":
+            conditions.append(
+                f"s.parent_id IN (SELECT id FROM symbols WHERE {column} = ?)"
+            )
+            params.append(pattern)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT file_path, file_hash FROM file_hashes")
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        sql = f"{self.__select(docs)} {where} ORDER BY s.id"
+        cursor.execute(
+            f"{sql} LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset),
+        )
+        while rows := cursor.fetchmany(self.__FETCH_SIZE):
+            for row in rows:
+                yield self.__to_symbol(row)
 
-    def update_file(
-        self, file_path: str, file_hash: str, symbols: List[Symbol]
-    ) -> None:
+    def find_fuzzy(
+        self,
+        query: str,
+        max_distance: int = Fuzzy.MAX_DISTANCE,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> List[Symbol]:
         cursor = self.__conn.cursor()
+        max_distance = min(max_distance, Fuzzy.MAX_DISTANCE)
+
+        variants = list(self.__fuzzy.variants(query, max_distance))
+        placeholders = ", ".join("?" * len(variants))
+        cursor.execute(
+            f"""
+            SELECT name FROM fuzzy_names WHERE term_id IN (
+                SELECT term_id FROM fuzzy_deletes
+                WHERE variant IN ({placeholders})
+            )
+        """,
+            variants,
+        )
 
-        cursor.execute("DELETE FROM symbols WHERE file_path = ?", (file_path,))
+        # only names sharing a delete with the query are ever scored
+        distances: Dict[str, int] = {}
+        for (name,) in cursor.fetchall():
+            dist = self.__fuzzy.distance(query, name, max_distance)
+            if dist <= max_distance:
+                distances[name] = dist
 
-        data = [
-            (
+        if not distances:
+            return []
+
+        # short or common queries can match more names than sqlite binds
+        rows = self.__select_in(
+            cursor,
+            f"{self.__select(docs)} WHERE s.name IN ({{}})",
+            list(distances),
+        )
+        symbols = [self.__to_symbol(row) for row in rows]
+        return self.rank_fuzzy(query, symbols, limit, offset, distances)
+
+    def rank_fuzzy(
+        self,
+        query: str,
+        symbols: List[Symbol],
+        limit: Optional[int] = None,
+        offset: int = 0,
+        distances: Optional[Dict[str, int]] = None,
+    ) -> List[Symbol]:
+        # also merges the candidates several shards returned for a query
+        limit = self.FUZZY_LIMIT if limit is None else limit
+        if distances is None:
+            distances = {
+                s.symbol_name: self.__fuzzy.distance(
+                    query, s.symbol_name, Fuzzy.MAX_DISTANCE
+                )
+                for s in symbols
+            }
+
+        # ranking needs every candidate, so fuzzy results are capped
+        # rather than streamed
+        ranked = heapq.nsmallest(
+            limit + offset,
+            symbols,
+            key=lambda s: (
+                distances[s.symbol_name],
+                self.__TYPE_CODES.get(s.symbol_type, len(self.__TYPE_CODES)),
                 s.symbol_name,
-                s.symbol_type,
                 s.file_path,
                 s.line_number,
-                s.signature,
-                s.docstring,
-            )
-            for s in symbols
+            ),
+        )
+        return ranked[offset:]
+
+    def iter_references(
+        self,
+        name: str,
+        kind: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Iterator[Reference]:
+        # one seek on idx_refs_name, which holds the primary key, so rows
+        # come back in file, line and column order without a sort
+        sql = """
+            SELECT r.name, r.kind, f.path, r.line, r.col
+            FROM refs r JOIN files f ON f.id = r.file_id
+            WHERE r.name = ?
+        """
+        params: List = [name]
+        if kind is not None:
+            sql += " AND r.kind = ?"
+            params.append(self.__KIND_CODES[kind])
+
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            f"""
+            {sql} ORDER BY r.file_id, r.line, r.col
+            LIMIT ? OFFSET ?
+        """,
+            (*params, -1 if limit is None else limit, offset),
+        )
+        while rows := cursor.fetchmany(self.__FETCH_SIZE):
+            for ref_name, code, path, line, column in rows:
+                yield Reference(
+                    ref_name,
+                    REFERENCE_KINDS[code],
+                    self.__absolute(path),
+                    line,
+                    column,
+                )
+
+    def __columns(self, docs: bool) -> str:
+        docstring = self.__DOCSTRING_COLUMN if docs else "NULL"
+        return f"{self.__SYMBOL_COLUMNS}, {docstring}"
+
+    def __select(self, docs: bool = False) -> str:
+        return f"""
+            SELECT {self.__columns(docs)}
+            FROM symbols s JOIN files f ON f.id = s.file_id
+        """
+
+    def __to_symbol(self, row: Tuple) -> Symbol:
+        name, type_code, path, line_number, signature, qual, docstring = row
+        return Symbol(
+            name,
+            self.__TYPE_NAMES[type_code],
+            self.__absolute(path),
+            line_number,
+            signature,
+            self.__decompress(docstring),
+            qual,
+        )
+
+    def __relative(self, file_path: str) -> str:
+        # the walker only yields paths under the root
+        if file_path.startswith(self.__prefix):
+            return file_path[len(self.__prefix) :]
+        return file_path
+
+    def __absolute(self, path: str) -> str:
+        return os.path.join(self.__root, path)
+
+    def __module(self, path: str) -> str:
+        # src/indexer.py -> src.indexer, pkg/__init__.py -> pkg
+        parts = os.path.splitext(path)[0].split(os.sep)
+        if parts[-1] == "__init__":
+            parts.pop()
+        return ".".join(parts)
+
+    def get_file_records(self) -> Dict[str, FileRecord]:
+        cursor = self.__conn.cursor()
+        cursor.execute("""
+            SELECT path, file_hash, size, mtime_ns, inode
+            FROM files
+        """)
+        return {
+            self.__absolute(row[0]): FileRecord(*row[1:])
+            for row in cursor.fetchall()
+        }
+
+    def get_file_record(self, file_path: str) -> Optional[FileRecord]:
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            """
+            SELECT file_hash, size, mtime_ns, inode
+            FROM files WHERE path = ?
+        """,
+            (self.__relative(file_path),),
+        )
+        row = cursor.fetchone()
+        return FileRecord(*row) if row else None
+
+    def read_file(
+        self, file_path: str
+    ) -> Optional[Tuple[List[Symbol], Set[str], List[Site], str]]:
+        # what update_file was given for the file, symbols in the order
+        # they were written so parent links come out the same again
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            "SELECT id FROM files WHERE path = ?",
+            (self.__relative(file_path),),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        file_id = row[0]
+
+        cursor.execute(
+            f"{self.__select(docs=True)} WHERE s.file_id = ? ORDER BY s.id",
+            (file_id,),
+        )
+        symbols = [self.__to_symbol(row) for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT name FROM used_names WHERE file_id = ?", (file_id,)
+        )
+        references = {name for (name,) in cursor.fetchall()}
+        cursor.execute(
+            "SELECT name, kind, line, col FROM refs WHERE file_id = ?",
+            (file_id,),
+        )
+        sites = [
+            (name, REFERENCE_KINDS[code], line, column)
+            for name, code, line, column in cursor.fetchall()
         ]
+        cursor.execute(
+            "SELECT reason FROM skipped_files WHERE file_id = ?", (file_id,)
+        )
+        row = cursor.fetchone()
+        return symbols, references, sites, row[0] if row else ""
+
+    def update_file(
+        self,
+        file_path: str,
+        record: FileRecord,
+        symbols: List[Symbol],
+        references: Iterable[str] = (),
+        sites: Iterable[Site] = (),
+        skipped: str = "",
+    ) -> None:
+        cursor = self.__conn.cursor()
+
+        # the id survives re-indexing, only the rows hanging off it change
+        file_id = self.__write_record(cursor, file_path, record)
+        removed = self.__delete_symbols(cursor, file_id)
+
+        # ids are assigned here so parent links resolve in one insert,
+        # symbols come in visit order so the enclosing scope is always
+        # the latest symbol seen with the parent's qualified name
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM symbols")
+        next_id = cursor.fetchone()[0] + 1
+        scopes: Dict[str, int] = {}
+        data = []
+        docstrings: List[Tuple[int, bytes]] = []
+        for symbol_id, s in enumerate(symbols, next_id):
+            qualname = s.qualified_name or s.symbol_name
+            parent, dot, _ = qualname.rpartition(".")
+            data.append(
+                (
+                    symbol_id,
+                    file_id,
+                    scopes.get(parent) if dot else None,
+                    s.symbol_name,
+                    qualname,
+                    self.__TYPE_CODES[s.symbol_type],
+                    s.line_number,
+                    s.signature,
+                    bool(s.docstring),
+                )
+            )
+            if s.docstring:
+                docstrings.append((symbol_id, self.__compress(s.docstring)))
+            scopes[qualname] = symbol_id
 
         cursor.executemany(
-            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)", data
+            """
+            INSERT INTO symbols (
+                id, file_id, parent_id, name, qualname, type,
+                line_number, signature, has_docstring
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            data,
+        )
+        cursor.executemany(
+            "INSERT INTO docstrings (symbol_id, text) VALUES (?, ?)",
+            docstrings,
+        )
+
+        if self.__has_trigrams:
+            cursor.execute(
+                """
+                INSERT INTO symbol_trigrams(rowid, name)
+                SELECT id, name FROM symbols WHERE file_id = ?
+            """,
+                (file_id,),
+            )
+
+        self.__fuzzy_deltas.update(s.symbol_name for s in symbols)
+        self.__fuzzy_deltas.subtract(removed)
+
+        cursor.executemany(
+            "INSERT INTO used_names (name, file_id) VALUES (?, ?)",
+            [(name, file_id) for name in references],
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO refs VALUES (?, ?, ?, ?, ?)",
+            [
+                (file_id, line, column, name, self.__KIND_CODES[kind])
+                for name, kind, line, column in sites
+            ],
         )
 
+        if skipped:
+            cursor.execute(
+                "INSERT INTO skipped_files (file_id, reason) VALUES (?, ?)",
+                (file_id, skipped),
+            )
+
+        types = Counter(s.symbol_type for s in symbols)
         cursor.execute(
-            "INSERT OR REPLACE INTO file_hashes (file_path, file_hash) VALUES (?, ?)",
-            (file_path, file_hash),
+            "INSERT OR REPLACE INTO file_stats VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                file_id,
+                len(symbols),
+                types["class"],
+                types["function"],
+                types["method"],
+                sum(1 for s in symbols if s.docstring),
+            ),
         )
 
-        self.__conn.commit()
+        self.__commit()
+
+    def update_file_stat(self, file_path: str, record: FileRecord) -> None:
+        # content unchanged, only refresh the stat tuple
+        cursor = self.__conn.cursor()
+        self.__write_record(cursor, file_path, record)
+        self.__commit()
+
+    def __write_record(
+        self, cursor: sqlite3.Cursor, file_path: str, record: FileRecord
+    ) -> int:
+        # update in place, a replace would hand the file a new id
+        path = self.__relative(file_path)
+        values = (record.file_hash, record.size, record.mtime_ns, record.inode)
+
+        cursor.execute("SELECT id FROM files WHERE path = ?", (path,))
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.execute(
+                """
+                UPDATE files
+                SET file_hash = ?, size = ?, mtime_ns = ?, inode = ?
+                WHERE id = ?
+            """,
+                (*values, row[0]),
+            )
+            return row[0]
+
+        cursor.execute(
+            """
+            INSERT INTO files (path, module, file_hash, size, mtime_ns, inode)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            (path, self.__module(path), *values),
+        )
+        # always set after a successful single row insert
+        file_id = cursor.lastrowid
+        assert file_id is not None
+        return file_id
 
     def remove_file(self, file_path: str) -> None:
         cursor = self.__conn.cursor()
-        cursor.execute("DELETE FROM symbols WHERE file_path = ?", (file_path,))
         cursor.execute(
-            "DELETE FROM file_hashes WHERE file_path = ?", (file_path,)
+            "SELECT id FROM files WHERE path = ?",
+            (self.__relative(file_path),),
         )
-        self.__conn.commit()
+        row = cursor.fetchone()
+        if row is None:
+            return
+
+        removed = self.__delete_symbols(cursor, row[0])
+        self.__fuzzy_deltas.subtract(removed)
+        cursor.execute("DELETE FROM file_stats WHERE file_id = ?", (row[0],))
+        cursor.execute("DELETE FROM files WHERE id = ?", (row[0],))
+        self.__commit()
+
+    def __delete_symbols(self, cursor: sqlite3.Cursor, file_id: int) -> Counter:
+        # returns how many symbols used each removed name
+        cursor.execute(
+            """
+            SELECT name, COUNT(*) FROM symbols
+            WHERE file_id = ?
+            GROUP BY name
+        """,
+            (file_id,),
+        )
+        removed = Counter(dict(cursor.fetchall()))
+
+        if self.__has_trigrams:
+            # external content fts needs the old values to drop its entries
+            cursor.execute(
+                """
+                INSERT INTO symbol_trigrams(symbol_trigrams, rowid, name)
+                SELECT 'delete', id, name FROM symbols WHERE file_id = ?
+            """,
+                (file_id,),
+            )
+        cursor.execute(
+            """
+            DELETE FROM docstrings WHERE symbol_id IN (
+                SELECT id FROM symbols WHERE file_id = ?
+            )
+        """,
+            (file_id,),
+        )
+        cursor.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+        cursor.execute("DELETE FROM used_names WHERE file_id = ?", (file_id,))
+        cursor.execute("DELETE FROM refs WHERE file_id = ?", (file_id,))
+        cursor.execute(
+            "DELETE FROM skipped_files WHERE file_id = ?", (file_id,)
+        )
+        return removed
+
+    def __flush_fuzzy(self) -> None:
+        # a name moving between files in one transaction nets out and its
+        # variants are never touched
+        deltas, self.__fuzzy_deltas = self.__fuzzy_deltas, Counter()
+        if deltas:
+            with get_timings().phase("fuzzy_index"):
+                self.__apply_fuzzy(self.__conn.cursor(), deltas)
+
+    def __apply_fuzzy(self, cursor: sqlite3.Cursor, deltas: Counter) -> None:
+        # deltas are per name symbol counts and the symbols are already
+        # written, a name is new when all its symbols are and gone when
+        # none are left. prefixes are reference counted by name, their
+        # variants only change when a prefix first appears or vanishes
+        names = [name for name, delta in deltas.items() if delta != 0]
+        counts: Dict[str, int] = dict(
+            self.__select_in(
+                cursor,
+                "SELECT name, COUNT(*) FROM symbols WHERE name IN ({}) "
+                "GROUP BY name",
+                names,
+            )
+        )
+        added = [n for n in names if counts.get(n, 0) == deltas[n] > 0]
+        removed = [n for n in names if n not in counts and deltas[n] < 0]
+        if not added and not removed:
+            return
+
+        term_deltas = Counter(self.__fuzzy.prefix(n) for n in added)
+        term_deltas.subtract(self.__fuzzy.prefix(n) for n in removed)
+        current: Dict[str, Tuple[int, int]] = {
+            term: (term_id, refs)
+            for term, term_id, refs in self.__select_in(
+                cursor,
+                "SELECT term, id, refs FROM fuzzy_terms WHERE term IN ({})",
+                list(term_deltas),
+            )
+        }
+
+        # new terms get ids above every existing one, so none is reused
+        # while its old variants are still being dropped
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM fuzzy_terms")
+        next_id = cursor.fetchone()[0] + 1
+        term_ids: Dict[str, int] = {}
+        inserted: List[Tuple[int, str, int]] = []
+        updated: List[Tuple[int, int]] = []
+        dropped: List[Tuple[int]] = []
+        new_variants: List[Tuple[str, int]] = []
+        old_variants: List[Tuple[str, int]] = []
+
+        for term, delta in term_deltas.items():
+            term_id, before = current.get(term, (next_id, 0))
+            term_ids[term] = term_id
+            refs = before + delta
+            if refs <= 0:
+                dropped.append((term_id,))
+                old_variants.extend(
+                    (v, term_id) for v in self.__fuzzy.variants(term)
+                )
+            elif before == 0:
+                inserted.append((term_id, term, refs))
+                new_variants.extend(
+                    (v, term_id) for v in self.__fuzzy.variants(term)
+                )
+                next_id += 1
+            elif delta != 0:
+                updated.append((refs, term_id))
+
+        # key order turns the b-tree writes into mostly sequential ones
+        old_variants.sort()
+        new_variants.sort()
+        cursor.executemany(
+            "DELETE FROM fuzzy_names WHERE term_id = ? AND name = ?",
+            [(term_ids[self.__fuzzy.prefix(n)], n) for n in removed],
+        )
+        cursor.executemany(
+            "DELETE FROM fuzzy_deletes WHERE variant = ? AND term_id = ?",
+            old_variants,
+        )
+        cursor.executemany("DELETE FROM fuzzy_terms WHERE id = ?", dropped)
+        cursor.executemany(
+            "INSERT INTO fuzzy_terms (id, term, refs) VALUES (?, ?, ?)",
+            inserted,
+        )
+        cursor.executemany(
+            "INSERT INTO fuzzy_deletes (variant, term_id) VALUES (?, ?)",
+            new_variants,
+        )
+        cursor.executemany(
+            "INSERT INTO fuzzy_names (term_id, name) VALUES (?, ?)",
+            sorted((term_ids[self.__fuzzy.prefix(n)], n) for n in added),
+        )
+        cursor.executemany(
+            "UPDATE fuzzy_terms SET refs = ? WHERE id = ?", updated
+        )
+
+    def __select_in(
+        self, cursor: sqlite3.Cursor, sql: str, keys: List[str]
+    ) -> List[Tuple]:
+        # sql has a single IN ({}) list, filled one chunk at a time
+        rows: List[Tuple] = []
+        for i in range(0, len(keys), self.__IN_CHUNK):
+            chunk = keys[i : i + self.__IN_CHUNK]
+            cursor.execute(sql.format(", ".join("?" * len(chunk))), chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+
+    @contextmanager
+    def bulk_write(
+        self, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[None]:
+        # every file's symbols and hash land in the same transaction, so a
+        # crash leaves unfinished files with their old hash and the next
+        # run redoes them
+        self.__batch_size = max(1, batch_size)
+        self.__pending = 0
+        try:
+            yield
+            self.__flush_fuzzy()
+            with get_timings().phase("commit"):
+                self.__conn.commit()
+        except BaseException:
+            self.__fuzzy_deltas.clear()
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__batch_size = None
+            self.__pending = 0
+
+    def __commit(self) -> None:
+        if self.__batch_size is not None:
+            self.__pending += 1
+            if self.__pending < self.__batch_size:
+                return
+            self.__pending = 0
+
+        self.__flush_fuzzy()
+        with get_timings().phase("commit"):
+            self.__conn.commit()
 
     def get_all_symbols(self) -> List[Symbol]:
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT * FROM symbols")
-        return [Symbol(*row) for row in cursor.fetchall()]
+        cursor.execute(f"{self.__select()} ORDER BY s.id")
+        return [self.__to_symbol(row) for row in cursor.fetchall()]
 
-    def get_file_count(self) -> int:
+    def get_unused_symbols(self) -> List[Symbol]:
+        # dunder names are invoked implicitly, never report them. uses
+        # inside partly indexed files are unknown, so neither are theirs
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM file_hashes")
-        return cursor.fetchone()[0]
+        cursor.execute(f"""
+            {self.__select()}
+            WHERE substr(s.name, 1, 2) != '__'
+            AND NOT EXISTS (
+                SELECT 1 FROM used_names u WHERE u.name = s.name
+            )
+            AND s.file_id NOT IN (SELECT file_id FROM skipped_files)
+            ORDER BY s.id
+        """)
+        return [self.__to_symbol(row) for row in cursor.fetchall()]
 
-    def get_total_symbol_count(self) -> int:
+    def get_used_names(self, names: Iterable[str]) -> Set[str]:
+        # which of the names any file in this index refers to
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM symbols")
-        return cursor.fetchone()[0]
+        names = list(names)
+        used: Set[str] = set()
+        for i in range(0, len(names), self.__IN_CHUNK):
+            chunk = names[i : i + self.__IN_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT DISTINCT name FROM used_names "
+                f"WHERE name IN ({placeholders})",
+                chunk,
+            )
+            used.update(name for (name,) in cursor.fetchall())
+        return used
 
-    def get_documented_symbol_count(self) -> int:
+    def get_skipped_files(self) -> Dict[str, str]:
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM symbols WHERE docstring != ''")
-        return cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT f.path, k.reason
+            FROM skipped_files k JOIN files f ON f.id = k.file_id
+        """)
+        return {self.__absolute(path): reason for path, reason in cursor}
+
+    def retry_skipped(self, limits: str) -> None:
+        # files skipped under other limits are parsed again, blank hashes
+        # and stats make the next diff treat them as modified
+        cursor = self.__conn.cursor()
+        cursor.execute("SELECT value FROM metadata WHERE key = 'limits'")
+        row = cursor.fetchone()
+        if row is not None and row[0] == limits:
+            return
+
+        cursor.execute("""
+            UPDATE files
+            SET file_hash = '', size = 0, mtime_ns = 0, inode = 0
+            WHERE id IN (SELECT file_id FROM skipped_files)
+        """)
+        cursor.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            ("limits", limits),
+        )
+        self.__conn.commit()
 
-    def get_symbol_counts_by_type(self) -> Dict[str, int]:
+    def get_totals(self) -> IndexTotals:
+        # one pass over the per file rows, never over symbols
         cursor = self.__conn.cursor()
-        cursor.execute("SELECT type, COUNT(*) FROM symbols GROUP BY type")
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(symbol_count), 0),
+                COALESCE(SUM(documented_count), 0),
+                COALESCE(SUM(class_count), 0),
+                COALESCE(SUM(function_count), 0),
+                COALESCE(SUM(method_count), 0)
+            FROM file_stats
+        """)
+        files, symbols, documented, *type_counts = cursor.fetchone()
+        by_type = {
+            name: count
+            for name, count in zip(self.__TYPE_CODES, type_counts)
+            if count
+        }
+        return IndexTotals(files, symbols, documented, by_type)
 
     def get_top_files_by_symbol_count(
         self, limit: int = 5
@@ -147,15 +1355,31 @@ class Storage:
         cursor = self.__conn.cursor()
         cursor.execute(
             """
-            SELECT file_path, COUNT(*) as count
-            FROM symbols
-            GROUP BY file_path
-            ORDER BY count DESC
+            SELECT f.path, st.symbol_count
+            FROM file_stats st JOIN files f ON f.id = st.file_id
+            WHERE st.symbol_count > 0
+            ORDER BY st.symbol_count DESC, st.file_id
             LIMIT ?
         """,
             (limit,),
         )
-        return [(row[0], row[1]) for row in cursor.fetchall()]
+        return [(self.__absolute(row[0]), row[1]) for row in cursor.fetchall()]
+
+    def get_hash_algorithm(self) -> str:
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            "SELECT value FROM metadata WHERE key = 'hash_algorithm'"
+        )
+        row = cursor.fetchone()
+        return row[0] if row else Hasher.DEFAULT
+
+    def set_hash_algorithm(self, algorithm: str) -> None:
+        cursor = self.__conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            ("hash_algorithm", algorithm),
+        )
+        self.__commit()
 
     def update_timestamp(self) -> None:
         now = datetime.now().isoformat()
@@ -171,8 +1395,44 @@ class Storage:
     def clear_database(self) -> None:
         cursor = self.__conn.cursor()
         cursor.execute("DELETE FROM symbols")
-        cursor.execute("DELETE FROM file_hashes")
-        cursor.execute("DELETE FROM metadata")
+        cursor.execute("DELETE FROM docstrings")
+        if self.__has_trigrams:
+            cursor.execute("""
+                INSERT INTO symbol_trigrams(symbol_trigrams)
+                VALUES ('delete-all')
+            """)
+        cursor.execute("DELETE FROM used_names")
+        cursor.execute("DELETE FROM refs")
+        cursor.execute("DELETE FROM skipped_files")
+        cursor.execute("DELETE FROM fuzzy_terms")
+        cursor.execute("DELETE FROM fuzzy_names")
+        cursor.execute("DELETE FROM fuzzy_deletes")
+        self.__fuzzy_deltas.clear()
+        cursor.execute("DELETE FROM file_stats")
+        cursor.execute("DELETE FROM files")
+        # the hasher and schema outlive the clear, keep their records
+        cursor.execute("""
+            DELETE FROM metadata
+            WHERE key NOT IN ('hash_algorithm', 'schema_version', 'limits')
+        """)
+        self.__conn.commit()
+
+    def export(self, target: str) -> None:
+        # a compacted, self contained copy without the wal
+        self.__conn.execute("VACUUM INTO ?", (target,))
+        copy = sqlite3.connect(target)
+        try:
+            copy.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            copy.close()
+
+    def forget_stats(self) -> None:
+        # stat info from another checkout means nothing here, the next
+        # diff then compares every file by hash and re-parses only real
+        # changes
+        self.__conn.execute(
+            "UPDATE files SET size = 0, mtime_ns = 0, inode = 0"
+        )
         self.__conn.commit()
 
     def close(self) -> None:
@@ -0,0 +1,75 @@
+import heapq
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional, Tuple
+
+
+class Timings:
+    # one shared no-op context keeps disabled instrumentation nearly free
+    __DISABLED = nullcontext()
+
+    def __init__(self, enabled: bool = True, slowest: int = 10) -> None:
+        self.enabled = enabled
+        self.__slowest = slowest
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        # min-heap of (seconds, path), holds the slowest files seen
+        self.files: List[Tuple[float, str]] = []
+
+    def phase(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return self.__DISABLED
+        return self.__measure(name)
+
+    @contextmanager
+    def __measure(self, name: str) -> Iterator[None]:
+        # phases accumulate, the same name may be entered many times
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_file(self, path: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        if len(self.files) < self.__slowest:
+            heapq.heappush(self.files, (seconds, path))
+        else:
+            heapq.heappushpop(self.files, (seconds, path))
+
+    def merge(self, other: "Timings") -> None:
+        # folds in numbers collected by a parser worker process
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for seconds, path in other.files:
+            self.record_file(path, seconds)
+
+    def to_dict(self) -> Dict:
+        return {
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "slowest_files": [
+                {"path": path, "seconds": seconds}
+                for seconds, path in sorted(self.files, reverse=True)
+            ],
+        }
+
+
+_active = Timings(enabled=False)
+
+
+def get_timings() -> Timings:
+    return _active
+
+
+def set_timings(timings: Optional[Timings]) -> None:
+    global _active
+    _active = timings if timings is not None else Timings(enabled=False)
@@ -1,17 +1,42 @@
+import json
+import os
+import sys
 from collections import defaultdict
-from typing import Dict, List
-from rich.console import Console
-from rich.columns import Columns
-from rich.table import Table
-from rich.panel import Panel
-from rich.tree import Tree
-from src.stats import CodebaseStats
-from src.storage import Symbol
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from rich.console import Console
+    from src.stats import CodebaseStats
+    from src.storage import Reference, Symbol
 
 
 class UI:
+    # plain search output is written this many lines at a time
+    __LINE_CHUNK = 256
+
+    # rich costs tens of milliseconds to import, it is only pulled in
+    # once something is actually rendered
     def __init__(self) -> None:
-        self.console = Console()
+        self.__console: Optional["Console"] = None
+        self.__err_console: Optional["Console"] = None
+
+    @property
+    def console(self) -> "Console":
+        if self.__console is None:
+            from rich.console import Console
+
+            self.__console = Console()
+        return self.__console
+
+    @property
+    def err_console(self) -> "Console":
+        # diagnostics go to stderr so they never mix with piped output
+        if self.__err_console is None:
+            from rich.console import Console
+
+            self.__err_console = Console(stderr=True)
+        return self.__err_console
 
     def print_success(self, message: str) -> None:
         self.console.print(f"[bold green]{message}[/bold green]")
@@ -22,7 +47,10 @@ class UI:
     def print_warning(self, message: str) -> None:
         self.console.print(f"[bold yellow]{message}[/bold yellow]")
 
-    def print_stats(self, symbols: List[Symbol]) -> None:
+    def print_stats(self, symbols: List["Symbol"]) -> None:
+        from rich.panel import Panel
+        from rich.table import Table
+
         func_count = sum(1 for s in symbols if s.symbol_type == "function")
         class_count = sum(1 for s in symbols if s.symbol_type == "class")
         method_count = sum(1 for s in symbols if s.symbol_type == "method")
@@ -44,55 +72,199 @@ class UI:
 
         self.console.print(panel)
 
-    def print_search_results(self, query: str, results: List[Symbol]) -> None:
-        if not results:
+    def print_search_results(
+        self,
+        query: str,
+        results: Iterable["Symbol"],
+        limit: Optional[int] = None,
+        offset: int = 0,
+        docs: bool = False,
+    ) -> None:
+        self.__print_grouped(
+            query,
+            results,
+            limit,
+            offset,
+            lambda symbols: self.__print_file_results(symbols, docs),
+        )
+
+    def print_reference_results(
+        self,
+        name: str,
+        references: Iterable["Reference"],
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> None:
+        self.__print_grouped(
+            name, references, limit, offset, self.__print_file_references
+        )
+
+    def __print_grouped(
+        self,
+        query: str,
+        results: Iterable,
+        limit: Optional[int],
+        offset: int,
+        render: Callable[[List], None],
+    ) -> None:
+        # results arrive file by file, each file is rendered as soon as
+        # the next one starts so output never waits for the whole set
+        count = 0
+        pending: List = []
+
+        for item in results:
+            if pending and item.file_path != pending[0].file_path:
+                render(pending)
+                pending = []
+            pending.append(item)
+            count += 1
+
+        if pending:
+            render(pending)
+
+        if count == 0:
             self.print_warning(f"No results found for {query}")
             return
 
-        self.console.print(
-            f"[bold]Found {len(results)} result(s) for {query}:[/bold]\n"
+        self.console.print(f"[bold]Found {count} result(s) for {query}[/bold]")
+        if limit is not None and count == limit:
+            self.console.print(
+                f"[dim]Use --offset {offset + count} for more[/dim]"
+            )
+
+    def __print_file_results(
+        self, symbols: List["Symbol"], docs: bool = False
+    ) -> None:
+        from rich.markup import escape
+        from rich.table import Table
+        from rich.tree import Tree
+
+        tree = Tree(f"[bold magenta]{symbols[0].file_path}[/bold magenta]")
+        # sort by line number
+        symbols.sort(key=lambda x: x.line_number)
+
+        table = Table(
+            box=None,
+            show_header=False,
+            pad_edge=False,
+            collapse_padding=True,
         )
+        table.add_column("Line", style="green", width=6)
+        table.add_column("Type", style="cyan", width=10)
+        table.add_column("Name", style="bold white")
+        table.add_column("Signature", style="dim white")
+
+        for s in symbols:
+            table.add_row(
+                str(s.line_number),
+                s.symbol_type,
+                s.qualified_name or s.symbol_name,
+                s.signature,
+            )
+            if docs and s.docstring:
+                table.add_row("", "", f"[dim italic]{escape(s.docstring)}")
 
-        # Group by file
-        grouped: Dict[str, List[Symbol]] = defaultdict(list)
-        for symbol in results:
-            grouped[symbol.file_path].append(symbol)
+        tree.add(table)
+        self.console.print(tree)
+        self.console.print("")
 
-        # Render as file tree
+    def __print_file_references(self, references: List["Reference"]) -> None:
+        import linecache
+        from rich.markup import escape
+        from rich.table import Table
+        from rich.tree import Tree
 
-        for file_path, symbols in grouped.items():
-            tree = Tree(f"[bold magenta]{file_path}[/bold magenta]")
-            # sort by line number
-            symbols.sort(key=lambda x: x.line_number)
+        path = references[0].file_path
+        tree = Tree(f"[bold magenta]{path}[/bold magenta]")
 
-            table = Table(
-                box=None,
-                show_header=False,
-                pad_edge=False,
-                collapse_padding=True,
+        table = Table(
+            box=None,
+            show_header=False,
+            pad_edge=False,
+            collapse_padding=True,
+        )
+        table.add_column("Line", style="green", width=9)
+        table.add_column("Kind", style="cyan", width=10)
+        table.add_column("Source", style="white")
+
+        for r in references:
+            source = linecache.getline(path, r.line_number).strip()
+            table.add_row(f"{r.line_number}:{r.column}", r.kind, escape(source))
+
+        tree.add(table)
+        self.console.print(tree)
+        self.console.print("")
+
+    def print_search_lines(
+        self,
+        query: str,
+        results: Iterable["Symbol"],
+        as_json: bool,
+        docs: bool = False,
+    ) -> None:
+        def line(s: "Symbol") -> str:
+            if as_json:
+                return json.dumps(vars(s))
+            text = (
+                f"{s.file_path}:{s.line_number}\t{s.symbol_type}"
+                f"\t{s.qualified_name or s.symbol_name}{s.signature}"
             )
-            table.add_column("Line", style="green", width=6)
-            table.add_column("Type", style="cyan", width=10)
-            table.add_column("Name", style="bold white")
-            table.add_column("Signature", style="dim white")
-
-            for s in symbols:
-                table.add_row(
-                    str(s.line_number),
-                    s.symbol_type,
-                    s.symbol_name,
-                    s.signature,
-                )
+            if docs:
+                # one line per symbol, only the summary line fits
+                summary = s.docstring.splitlines()[0] if s.docstring else ""
+                text = f"{text}\t{summary}"
+            return text
+
+        self.__write_lines(query, (line(s) for s in results))
+
+    def print_reference_lines(
+        self, name: str, references: Iterable["Reference"], as_json: bool
+    ) -> None:
+        # path:line:col first, the form editors and grep users jump to
+        self.__write_lines(
+            name,
+            (
+                json.dumps(vars(r))
+                if as_json
+                else f"{r.file_path}:{r.line_number}:{r.column}"
+                f"\t{r.kind}\t{r.name}"
+                for r in references
+            ),
+        )
 
-            tree.add(table)
-            self.console.print(tree)
-            self.console.print("")
+    def __write_lines(self, query: str, results: Iterable[str]) -> None:
+        # one line per result for pipes and scripts, written in chunks
+        # without rich, json mode emits one object per line
+        lines: List[str] = []
+        count = 0
+        try:
+            for line in results:
+                lines.append(line + "\n")
+                count += 1
+                if len(lines) >= self.__LINE_CHUNK:
+                    sys.stdout.write("".join(lines))
+                    sys.stdout.flush()
+                    lines = []
+
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # the reader went away (head, less), silence the final flush
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            return
+
+        if count == 0:
+            self.err_console.print(
+                f"[bold yellow]No results found for {query}[/bold yellow]"
+            )
 
     def print_file_status(self, diff) -> None:
         if not (diff.added or diff.modified or diff.deleted):
             self.console.print(
                 "[green]Working directory clean. Index up to date[/green]"
             )
+            self.__print_skipped(diff.skipped)
             return
 
         self.console.print("[bold]Changes not in index:[/bold]\n")
@@ -109,8 +281,76 @@ class UI:
                 self.console.print(f"  [green]new file: {path}[/green]")
 
         self.console.print("\n[dim] Run 'atlas index' to update[/dim]")
+        self.__print_skipped(diff.skipped)
+
+    def __print_skipped(self, skipped: Dict[str, str]) -> None:
+        from rich.markup import escape
+
+        if not skipped:
+            return
+        self.console.print("\n[bold]Skipped or partly indexed:[/bold]")
+        for path in sorted(skipped):
+            self.console.print(
+                f"  [magenta]{escape(path)}[/magenta] "
+                f"[dim]({escape(skipped[path])})[/dim]"
+            )
+
+    def print_watch_update(self, diff) -> None:
+        now = datetime.now().strftime("%H:%M:%S")
+
+        for path in sorted(diff.added):
+            self.console.print(
+                f"[dim]{now}[/dim] [green]indexed: {path}[/green]"
+            )
+
+        for path in sorted(diff.modified):
+            self.console.print(
+                f"[dim]{now}[/dim] [yellow]updated: {path}[/yellow]"
+            )
+
+        for path in sorted(diff.deleted):
+            self.console.print(f"[dim]{now}[/dim] [red]removed: {path}[/red]")
+
+    def print_timings(self, data: Dict, as_json: bool = False) -> None:
+        if as_json:
+            sys.stderr.write(json.dumps(data, indent=2) + "\n")
+            return
+
+        from rich.table import Table
+
+        phases = Table(title="Phases", box=None)
+        phases.add_column("Phase", style="cyan")
+        phases.add_column("Time", justify="right", style="green")
+        for name, seconds in sorted(
+            data["phases"].items(), key=lambda item: -item[1]
+        ):
+            phases.add_row(name, f"{seconds * 1000:.1f} ms")
+
+        counters = Table(title="Counters", box=None)
+        counters.add_column("Counter", style="cyan")
+        counters.add_column("Value", justify="right")
+        for name, value in sorted(data["counters"].items()):
+            counters.add_row(name, f"{value:,}")
+
+        self.err_console.print(phases)
+        if data["counters"]:
+            self.err_console.print(counters)
+
+        if data["slowest_files"]:
+            slowest = Table(title="Slowest Files To Parse", box=None)
+            slowest.add_column("Time", justify="right", style="red")
+            slowest.add_column("File", style="magenta")
+            for entry in data["slowest_files"]:
+                slowest.add_row(
+                    f"{entry['seconds'] * 1000:.1f} ms", entry["path"]
+                )
+            self.err_console.print(slowest)
+
+    def print_advanced_stats(self, stats: "CodebaseStats") -> None:
+        from rich.columns import Columns
+        from rich.panel import Panel
+        from rich.table import Table
 
-    def print_advanced_stats(self, stats: CodebaseStats) -> None:
         grid = Table.grid(expand=True)
         grid.add_column()
         grid.add_column(justify="right")
@@ -159,7 +399,10 @@ class UI:
         self.console.print(Columns([overview_panel, dist_panel]))
         self.console.print(hotspot_panel)
 
-    def print_unused(self, symbols: List[Symbol]) -> None:
+    def print_unused(self, symbols: List["Symbol"]) -> None:
+        from rich.table import Table
+        from rich.tree import Tree
+
         if not symbols:
             self.print_success("No unused symbols detected")
             return
@@ -170,7 +413,7 @@ class UI:
             }[/bold yellow]\n"
         )
 
-        grouped: Dict[str, List[Symbol]] = defaultdict(list)
+        grouped: Dict[str, List["Symbol"]] = defaultdict(list)
         for symbol in symbols:
             grouped[symbol.file_path].append(symbol)
 
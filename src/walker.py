@@ -0,0 +1,200 @@
+import os
+import pathspec
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+from src.project import Project
+
+# (directory relative to root, compiled rules for that directory)
+Matcher = Tuple[str, pathspec.PathSpec]
+
+
+class Walker:
+    __DEFAULT_IGNORES = [
+        ".git",
+        ".atlas",
+        "__pycache__",
+        ".venv",
+        "venv",
+        "node_modules",
+        "*.pyc",
+        ".DS_Store",
+    ]
+    # plain names from the defaults, checked per path component when git
+    # supplies the file list and no pattern needs evaluating
+    __DEFAULT_NAMES = frozenset(
+        name for name in __DEFAULT_IGNORES if "*" not in name
+    )
+    __GITIGNORE_FILE = ".gitignore"
+    __EXCLUDE_FILE = Path(".git") / "info" / "exclude"
+
+    def __init__(
+        self,
+        project: Project,
+        extensions: Tuple[str, ...] = (".py",),
+        start: Optional[Path] = None,
+        excluded: Iterable[Path] = (),
+    ) -> None:
+        self.__root = project.root
+        self.__extensions = extensions
+        self.__root_matchers = self.__load_root_matchers()
+        # a shard walks its own subtree and leaves nested shards alone,
+        # ignore rules are still resolved from the project root
+        self.__start = start if start is not None else self.__root
+        self.__excluded = {str(path) for path in excluded}
+        self.__start_prefix = os.path.join(str(self.__start), "")
+        self.__excluded_prefixes = tuple(
+            os.path.join(path, "") for path in self.__excluded
+        )
+
+    @property
+    def extensions(self) -> Tuple[str, ...]:
+        return self.__extensions
+
+    def walk(self) -> Iterator[os.DirEntry]:
+        for entry, is_dir in self.__scan():
+            if not is_dir and entry.name.endswith(self.__extensions):
+                yield entry
+
+    def directories(self) -> Iterator[str]:
+        # every directory the walk would enter, root included
+        yield str(self.__start)
+        for entry, is_dir in self.__scan():
+            if is_dir:
+                yield entry.path
+
+    def contains(self, file_path: str) -> bool:
+        # inside the walked subtree and outside every excluded one
+        return file_path.startswith(self.__start_prefix) and not (
+            file_path.startswith(self.__excluded_prefixes)
+        )
+
+    def is_default_ignored(self, file_path: str) -> bool:
+        rel = file_path[len(self.__start_prefix) :]
+        return any(part in self.__DEFAULT_NAMES for part in rel.split(os.sep))
+
+    def accepts(self, path: Path) -> bool:
+        return path.name.endswith(self.__extensions) and not self.is_ignored(
+            path
+        )
+
+    def __scan(self) -> Iterator[Tuple[os.DirEntry, bool]]:
+        # depth first over directories, ignored subtrees are never opened
+        stack: List[Tuple[str, str, List[Matcher]]] = [self.__start_frame()]
+
+        while stack:
+            dir_path, rel_dir, matchers = stack.pop()
+
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+
+            if any(e.name == self.__GITIGNORE_FILE for e in entries):
+                local = self.__load_gitignore(Path(dir_path), rel_dir)
+                if local is not None:
+                    matchers = matchers + [local]
+
+            subdirs = []
+            for entry in entries:
+                rel_path = f"{rel_dir}{entry.name}"
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if self.__is_ignored(rel_path, is_dir, matchers):
+                    continue
+                if is_dir and entry.path in self.__excluded:
+                    continue
+
+                yield entry, is_dir
+                if is_dir:
+                    subdirs.append((entry.path, f"{rel_path}/", matchers))
+
+            # reversed so directories come off the stack in listing order
+            stack.extend(reversed(subdirs))
+
+    def __start_frame(self) -> Tuple[str, str, List[Matcher]]:
+        # rules from every directory above the start, the start's own
+        # .gitignore is picked up when the scan lists it
+        matchers = list(self.__root_matchers)
+        rel_dir = ""
+        directory = self.__root
+
+        for part in self.__start.relative_to(self.__root).parts:
+            local = self.__load_gitignore(directory, rel_dir)
+            if local is not None:
+                matchers.append(local)
+            rel_dir = f"{rel_dir}{part}/"
+            directory = directory / part
+
+        return str(self.__start), rel_dir, matchers
+
+    def is_ignored(self, path: Path, is_dir: bool = False) -> bool:
+        # single path check, applies every .gitignore between root and path
+        try:
+            rel = path.resolve().relative_to(self.__root)
+        except ValueError:
+            return True
+
+        matchers = list(self.__root_matchers)
+        rel_dir = ""
+        directory = self.__root
+        parts = rel.parts
+
+        for i, part in enumerate(parts):
+            local = self.__load_gitignore(directory, rel_dir)
+            if local is not None:
+                matchers.append(local)
+
+            last = i == len(parts) - 1
+            rel_path = f"{rel_dir}{part}"
+            if self.__is_ignored(rel_path, is_dir or not last, matchers):
+                return True
+
+            rel_dir = f"{rel_path}/"
+            directory = directory / part
+
+        return False
+
+    def __is_ignored(
+        self, rel_path: str, is_dir: bool, matchers: List[Matcher]
+    ) -> bool:
+        candidate = f"{rel_path}/" if is_dir else rel_path
+
+        # deepest rules win, the first matcher with an opinion decides
+        for base, spec in reversed(matchers):
+            result = spec.check_file(candidate[len(base) :])
+            if result.include is not None:
+                return result.include
+
+        return False
+
+    def __load_root_matchers(self) -> List[Matcher]:
+        # lowest priority first: built-in defaults, then .git/info/exclude
+        matchers: List[Matcher] = [("", self.__compile(self.__DEFAULT_IGNORES))]
+
+        exclude = self.__read_lines(self.__root / self.__EXCLUDE_FILE)
+        if exclude:
+            matchers.append(("", self.__compile(exclude)))
+
+        return matchers
+
+    def __load_gitignore(
+        self, directory: Path, rel_dir: str
+    ) -> Optional[Matcher]:
+        lines = self.__read_lines(directory / self.__GITIGNORE_FILE)
+        if not lines:
+            return None
+        return rel_dir, self.__compile(lines)
+
+    def __compile(self, lines: List[str]) -> pathspec.PathSpec:
+        return pathspec.PathSpec.from_lines("gitwildmatch", lines)
+
+    def __read_lines(self, path: Path) -> List[str]:
+        try:
+            with open(path, "r") as f:
+                return f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            return []
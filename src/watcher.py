@@ -0,0 +1,237 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Set, Tuple
+from src.indexer import FileDiff, Indexer
+from src.project import Project
+from src.walker import Walker
+
+
+class WatchBackend(ABC):
+    @abstractmethod
+    def read(self, timeout: Optional[float]) -> Tuple[Set[str], bool]:
+        # changed paths, and whether a full rescan is needed
+        pass
+
+    @abstractmethod
+    def refresh(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+
+class InotifyBackend(WatchBackend):
+    __IN_CLOSE_WRITE = 0x00000008
+    __IN_MOVED_FROM = 0x00000040
+    __IN_MOVED_TO = 0x00000080
+    __IN_CREATE = 0x00000100
+    __IN_DELETE = 0x00000200
+    __IN_Q_OVERFLOW = 0x00004000
+    __IN_IGNORED = 0x00008000
+    __IN_ISDIR = 0x40000000
+    __IN_NONBLOCK = 0o4000
+    __IN_CLOEXEC = 0o2000000
+
+    __MASK = (
+        __IN_CLOSE_WRITE
+        | __IN_MOVED_FROM
+        | __IN_MOVED_TO
+        | __IN_CREATE
+        | __IN_DELETE
+    )
+    __HEADER = struct.Struct("iIII")
+
+    def __init__(self, walker: Walker) -> None:
+        self.__walker = walker
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.__fd = self.__libc.inotify_init1(
+            self.__IN_NONBLOCK | self.__IN_CLOEXEC
+        )
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> directory it was added for
+        self.__watches: Dict[int, str] = {}
+        self.refresh()
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        except OSError:
+            return False
+        return hasattr(libc, "inotify_init1")
+
+    @property
+    def name(self) -> str:
+        return "inotify"
+
+    def refresh(self) -> None:
+        # adding an existing watch returns the same descriptor, so this
+        # only picks up directories created since the last call
+        for directory in self.__walker.directories():
+            wd = self.__libc.inotify_add_watch(
+                self.__fd, os.fsencode(directory), self.__MASK
+            )
+            if wd >= 0:
+                self.__watches[wd] = directory
+
+    def read(self, timeout: Optional[float]) -> Tuple[Set[str], bool]:
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if not ready:
+            return set(), False
+
+        try:
+            data = os.read(self.__fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+
+        paths: Set[str] = set()
+        rescan = False
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = self.__HEADER.unpack_from(data, offset)
+            offset += self.__HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & self.__IN_Q_OVERFLOW:
+                rescan = True
+                continue
+
+            if mask & self.__IN_IGNORED:
+                self.__watches.pop(wd, None)
+                continue
+
+            directory = self.__watches.get(wd)
+            if directory is None:
+                continue
+
+            if mask & self.__IN_ISDIR:
+                # whole subtrees appeared or vanished, let a rescan sort it
+                rescan = True
+                continue
+
+            file_name = os.fsdecode(name)
+            if file_name.endswith(self.__walker.extensions):
+                paths.add(os.path.join(directory, file_name))
+
+        return paths, rescan
+
+    def close(self) -> None:
+        os.close(self.__fd)
+
+
+class PollingBackend(WatchBackend):
+    def __init__(self, walker: Walker, interval: float) -> None:
+        self.__walker = walker
+        self.__interval = interval
+        self.__snapshot = self.__take_snapshot()
+
+    @property
+    def name(self) -> str:
+        return "polling"
+
+    def refresh(self) -> None:
+        self.__snapshot = self.__take_snapshot()
+
+    def read(self, timeout: Optional[float]) -> Tuple[Set[str], bool]:
+        time.sleep(self.__interval)
+
+        current = self.__take_snapshot()
+        changed = {
+            path
+            for path in current.keys() | self.__snapshot.keys()
+            if current.get(path) != self.__snapshot.get(path)
+        }
+        self.__snapshot = current
+        return changed, False
+
+    def __take_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot: Dict[str, Tuple[int, int, int]] = {}
+        for entry in self.__walker.walk():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return snapshot
+
+
+class Watcher:
+    def __init__(
+        self,
+        project: Project,
+        debounce: float = 0.2,
+        poll: bool = False,
+        interval: float = 1.0,
+    ) -> None:
+        self.__indexer = Indexer(project)
+        self.__debounce = debounce
+        # continuous writes still get flushed after this long
+        self.__max_delay = max(debounce * 10, 1.0)
+
+        walker = Walker(project)
+        if poll or not InotifyBackend.available():
+            self.__backend: WatchBackend = PollingBackend(walker, interval)
+        else:
+            self.__backend = InotifyBackend(walker)
+
+    @property
+    def backend(self) -> str:
+        return self.__backend.name
+
+    def sync(self) -> FileDiff:
+        return self.__indexer.sync()
+
+    def run(self, on_change: Callable[[FileDiff], None]) -> None:
+        pending: Set[str] = set()
+        rescan = False
+        first_event = 0.0
+
+        try:
+            while True:
+                waiting = bool(pending) or rescan
+                paths, overflow = self.__backend.read(
+                    self.__debounce if waiting else None
+                )
+
+                if paths or overflow:
+                    if not waiting:
+                        first_event = time.monotonic()
+                    pending |= paths
+                    rescan = rescan or overflow
+                    overdue = time.monotonic() - first_event
+                    if overdue < self.__max_delay:
+                        continue
+
+                if not (pending or rescan):
+                    continue
+
+                # quiet for a full debounce window, apply the burst at once
+                if rescan:
+                    self.__backend.refresh()
+                    diff = self.__indexer.sync()
+                else:
+                    diff = self.__indexer.update_paths(pending)
+
+                pending = set()
+                rescan = False
+
+                if diff.added or diff.modified or diff.deleted:
+                    on_change(diff)
+        finally:
+            self.__backend.close()
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class SearchStartupTest(unittest.TestCase):
+    # a search only opens the index, none of this is needed for it and
+    # each of these once slipped onto the search path
+    FORBIDDEN = (
+        "src.indexer",
+        "src.walker",
+        "src.parsers",
+        "src.cache",
+        "src.commits",
+        "src.git",
+        "pathspec",
+        "concurrent.futures",
+        "multiprocessing",
+    )
+    # total import time of an `atlas search` process, best of RUNS, in ms
+    BUDGET_MS = float(os.environ.get("ATLAS_IMPORT_BUDGET_MS", "250"))
+    RUNS = 5
+
+    _tmp: tempfile.TemporaryDirectory
+    project: Path
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.project = Path(cls._tmp.name)
+        (cls.project / "app.py").write_text("def handler():\n    pass\n")
+        cls.__atlas("init")
+        cls.__atlas("index")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._tmp.cleanup()
+
+    def test_search_skips_indexing_modules(self) -> None:
+        modules, _ = self.__search_imports()
+        loaded = sorted(
+            name
+            for name in modules
+            for prefix in self.FORBIDDEN
+            if name == prefix or name.startswith(f"{prefix}.")
+        )
+        self.assertEqual(loaded, [], "atlas search imports indexing modules")
+
+    def test_search_import_budget(self) -> None:
+        # the first run writes bytecode, the best run filters out noise
+        best = min(self.__search_imports()[1] for _ in range(self.RUNS))
+        self.assertLessEqual(
+            best,
+            self.BUDGET_MS,
+            f"atlas search spends {best:.0f} ms importing, "
+            f"budget is {self.BUDGET_MS:.0f} ms",
+        )
+
+    @classmethod
+    def __atlas(
+        cls, *args: str, flags: Tuple[str, ...] = ()
+    ) -> subprocess.CompletedProcess:
+        # bytecode is written so runs after the first measure imports,
+        # not compilation
+        env = {**os.environ, "ATLAS_PARSE_CACHE": "0"}
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        return subprocess.run(
+            [sys.executable, *flags, str(ROOT / "main.py"), *args],
+            cwd=cls.project,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+    def __search_imports(self) -> Tuple[List[str], float]:
+        # -X importtime lines are "import time: self | cumulative | name",
+        # top level imports are indented by one space only
+        result = self.__atlas("search", "handler", flags=("-X", "importtime"))
+        modules: List[str] = []
+        total: Dict[str, int] = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            modules.append(name.strip())
+            if not name.startswith("  "):
+                total[name.strip()] = int(cumulative)
+        return modules, sum(total.values()) / 1000
+
+
+if __name__ == "__main__":
+    unittest.main()